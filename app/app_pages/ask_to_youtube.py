@@ -4,14 +4,20 @@ This file is "Ask to Youtube" app page.
 
 import streamlit as st
 
-from common.streamlit_utils import display_chat_history, talk
+from common.history import HistoryWindow
+from common.streamlit_utils import (
+    display_chat_history,
+    session_history,
+    session_object,
+    shared_openai_client,
+    talk,
+    talk_stream,
+)
 from common.ask_for_youtube import get_answer_in_youtube, get_youtube_video_id_from_url
 
-if "video_id" not in st.session_state:
-    st.session_state.video_id = ""
-
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+session_object("video_id", str)
+session_history("chat_history")
+session_object("history_window", lambda: HistoryWindow(client=shared_openai_client()))
 
 st.session_state.video_id = get_youtube_video_id_from_url(st.text_input("Please input youtube video link url."))
 
@@ -22,5 +28,11 @@ if prompt:
     with st.chat_message("user"):
         talk(prompt, "user", st.session_state.chat_history)
     with st.chat_message("assistant"):
-        response = get_answer_in_youtube(st.session_state.video_id, prompt, st.session_state.chat_history)
-        talk(response, "assistant", st.session_state.chat_history)
+        response = get_answer_in_youtube(
+            st.session_state.video_id,
+            prompt,
+            st.session_state.chat_history,
+            stream=True,
+            window=st.session_state.history_window,
+        )
+        talk_stream(response, "assistant", st.session_state.chat_history)
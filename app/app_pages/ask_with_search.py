@@ -8,10 +8,18 @@ using the chat_with_search function.
 import streamlit as st
 
 from common.ask_with_search import chat_with_search
-from common.streamlit_utils import display_chat_history, talk
+from common.history import HistoryWindow
+from common.streamlit_utils import (
+    display_chat_history,
+    session_history,
+    session_object,
+    shared_openai_client,
+    talk,
+    talk_stream,
+)
 
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+session_history("chat_history")
+session_object("history_window", lambda: HistoryWindow(client=shared_openai_client()))
 
 display_chat_history(st.session_state.chat_history)
 
@@ -20,5 +28,10 @@ if prompt:
     with st.chat_message("user"):
         talk(prompt, "user", st.session_state.chat_history)
     with st.chat_message("assistant"):
-        response = chat_with_search(prompt, st.session_state.chat_history)
-        talk(response, "assistant", st.session_state.chat_history)
+        response = chat_with_search(
+            prompt,
+            st.session_state.chat_history,
+            stream=True,
+            window=st.session_state.history_window,
+        )
+        talk_stream(response, "assistant", st.session_state.chat_history)
@@ -5,22 +5,15 @@ This file is "My Chat Bot" app page.
 import streamlit as st
 
 from common.chat import Chat
+from common.streamlit_utils import display_chat_history, session_history, session_object, shared_openai_client
 
+chat = session_object("chat", lambda: Chat(history=session_history("chat_bot_history"), client=shared_openai_client()))
 
-chat = Chat()
-
-if "chat" not in st.session_state:
-    st.session_state.chat = Chat()
-
-for content in st.session_state.chat.history:
-    if content["role"] != "system":
-        with st.chat_message(content["role"]):
-            st.markdown(content["content"])
+display_chat_history(chat.history, key="chat")
 
 prompt = st.chat_input("메시지를 입력하세요")
 if prompt:
     with st.chat_message("user"):
         st.markdown(prompt)
     with st.chat_message("assistant"):
-        response = st.session_state.chat.discuss(prompt)
-        st.markdown(response)
+        st.write_stream(chat.discuss_stream(prompt))
@@ -0,0 +1,5 @@
+"""
+This package contains benchmarks for the chat bot engines.
+
+Run them from the app directory, e.g. `python -m benchmarks.pdf_extraction some.pdf`.
+"""
@@ -0,0 +1,83 @@
+"""
+This benchmark compares the memory of the chat histories kept as lists with the ConversationStore.
+
+Every session appends the same number of messages. It reports the memory retained by all histories,
+and the time of an append and of reading the window of a rerun (the last messages) per session.
+The store writes to a temporary database, so the data directory is not touched.
+
+Usage:
+    python -m benchmarks.conversation_store --sessions 200 --messages 200
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common.conversation_store import ConversationStore
+from settings import history_display_window
+
+
+def message(session: int, index: int) -> dict:
+    """
+    This function returns a message of a session, about as long as an answer.
+    """
+    role = "user" if index % 2 == 0 else "assistant"
+    return {"role": role, "content": f"Session {session} message {index}. " + "Some answer text. " * 40}
+
+
+def measure(new_history, sessions: int, messages: int) -> dict:
+    """
+    This function fills the histories of the sessions and measures them.
+
+    Args:
+        new_history (Callable): The function returning the empty history of a session.
+        sessions (int): The number of sessions.
+        messages (int): The number of messages per session.
+
+    Returns:
+        dict: The retained megabytes and the microseconds per append and per window read.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    histories = [new_history(session) for session in range(sessions)]
+    started = time.perf_counter()
+    for index in range(messages):
+        for session, history in enumerate(histories):
+            history.append(message(session, index))
+    appended = time.perf_counter() - started
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for history in histories:
+        _ = history[-history_display_window:]
+    read = time.perf_counter() - started
+    return {
+        "mb": retained / 1024 / 1024,
+        "append_us": appended / (sessions * messages) * 1e6,
+        "window_us": read / sessions * 1e6,
+    }
+
+
+def main():
+    """
+    This function runs the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--memory-cap", type=int, default=16 * 1024 * 1024, help="The memory cap of the store")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ConversationStore(os.path.join(directory, "conversations.sqlite3"), memory_cap=args.memory_cap)
+        print(f"{'history':<8} {'retained MB':>12} {'append us':>10} {'window us':>10}")
+        for name, new_history in (("list", lambda _: []), ("store", lambda session: store.history(str(session)))):
+            report = measure(new_history, args.sessions, args.messages)
+            print(f"{name:<8} {report['mb']:>12.1f} {report['append_us']:>10.1f} {report['window_us']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+This benchmark measures the chat engines end to end against the local stand-in server.
+
+Every scenario runs N simulated sessions at once, each asking a few turns in a row, and reports
+the p50/p95/p99 turn latency, the median time to the first streamed piece, the OpenAI and search
+requests per turn and the throughput. No request leaves the host, so runs are comparable.
+
+Scenarios:
+    search       chat_with_search
+    search-spec  chat_with_search, searching during the classification
+    chat         Chat.discuss with structured dispatch
+    chat-legacy  Chat.discuss with the state machine
+    youtube      get_answer_in_youtube, with a synthetic transcript
+    pdf          OpenAIClient.pdf_to_embeddings, with --pdf
+
+Usage:
+    python -m benchmarks.engines --sessions 1 8 32 --turns 5 --latency openai=0.3 --latency 0.05 --jitter 0.02
+"""
+
+import argparse
+import itertools
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from benchmarks.stub_servers import StubServer, add_profile_arguments, parse_profiles
+
+SCENARIOS = ("search", "search-spec", "chat", "chat-legacy", "youtube", "pdf")
+
+# Sessions get new ids across runs, so their questions miss the caches filled by the previous runs
+SESSION_IDS = itertools.count()
+
+# The stand-in server is the only upstream, so the quotas of the real providers do not apply
+UNLIMITED = {
+    "RATE_LIMIT_BACKEND": "memory",
+    "OPENAI_RPS": "1000000",
+    "OPENAI_TPM": "1000000000",
+    "SEARCH_RPS": "1000000",
+    "NAVER_DAILY_QUOTA": "1000000000",
+    "KAKAO_DAILY_QUOTA": "1000000000",
+    "GOOGLE_DAILY_QUOTA": "1000000000",
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    This function returns the q-th percentile of the values, by linear interpolation.
+
+    Args:
+        values (list[float]): The values.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or NaN without values.
+    """
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def synthetic_transcript(video_id: str, minutes: int = 20) -> List[dict]:
+    """
+    This function returns a transcript of a few sentences every five seconds.
+
+    Args:
+        video_id (str): The id of the video.
+        minutes (int): The length of the video.
+
+    Returns:
+        list[dict]: The transcript segments.
+    """
+    return [
+        {"text": f"{video_id} segment {i} talks about the topic in detail", "start": i * 5.0, "duration": 5.0}
+        for i in range(minutes * 12)
+    ]
+
+
+def load_scenarios(pdf_path: str = None) -> Dict[str, Callable[[int], Callable[[int], object]]]:
+    """
+    This function imports the engines and returns the scenarios.
+    The engines read their settings on import, so it must run once the environment points at the server.
+
+    Args:
+        pdf_path (str): The PDF of the pdf scenario.
+
+    Returns:
+        dict: For each scenario, a function building the turn function of a session from its index.
+            A turn function takes the turn index and returns the answer or its stream.
+    """
+    # pylint: disable=import-outside-toplevel
+    from common.ask_for_youtube import get_answer_in_youtube, transcript_indexes
+    from common.ask_with_search import chat_with_search
+    from common.chat import Chat
+    from common.client import get_openai_client
+
+    transcript_indexes.load = synthetic_transcript
+
+    def search(speculate: bool):
+        def session_turns(session: int):
+            history = []
+            return lambda turn: chat_with_search(
+                f"What is the latest news about topic {session}-{turn}?", history, True, speculate=speculate
+            )
+
+        return session_turns
+
+    def chat(structured: bool):
+        def session_turns(session: int):
+            bot = Chat(structured=structured, client=get_openai_client())
+            return lambda turn: bot.discuss_stream(f"Can you explain topic {session}-{turn}?")
+
+        return session_turns
+
+    def youtube(session: int):
+        history = []
+        return lambda turn: get_answer_in_youtube(f"video{session}", f"What is said about {turn}?", history, True)
+
+    def pdf(_: int):
+        return lambda _: get_openai_client().pdf_to_embeddings(pdf_path)
+
+    return {
+        "search": search(False),
+        "search-spec": search(True),
+        "chat": chat(True),
+        "chat-legacy": chat(False),
+        "youtube": youtube,
+        "pdf": pdf,
+    }
+
+
+def run_session(turns: Callable[[int], object], count: int) -> List[dict]:
+    """
+    This function runs the turns of one session in a row.
+
+    Args:
+        turns (Callable): The turn function of the session.
+        count (int): The number of turns.
+
+    Returns:
+        list[dict]: The latency, time to the first piece and error of each turn.
+    """
+    results = []
+    for turn in range(count):
+        started = time.perf_counter()
+        first = None
+        error = None
+        try:
+            answer = turns(turn)
+            if not isinstance(answer, (str, list)):
+                for _ in answer:
+                    first = first or time.perf_counter() - started
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            error = repr(e)
+        latency = time.perf_counter() - started
+        results.append({"latency": latency, "first": first or latency, "error": error})
+    return results
+
+
+def run_scenario(server: StubServer, session_turns: Callable, sessions: int, turns: int) -> dict:
+    """
+    This function runs a scenario with simulated sessions in parallel.
+
+    Args:
+        server (StubServer): The stand-in server.
+        session_turns (Callable): The function building the turn function of a session.
+        sessions (int): The number of concurrent sessions.
+        turns (int): The number of turns per session.
+
+    Returns:
+        dict: The report of the scenario.
+    """
+    before = server.snapshot()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        futures = [executor.submit(run_session, session_turns(next(SESSION_IDS)), turns) for _ in range(sessions)]
+        results = [result for future in futures for result in future.result()]
+    elapsed = time.perf_counter() - started
+    requests = server.snapshot()
+    requests.subtract(before)
+
+    done = [result for result in results if result["error"] is None]
+    latencies = [result["latency"] for result in done]
+    total = len(results)
+    return {
+        "turns": total,
+        "errors": total - len(done),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "first": statistics.median([result["first"] for result in done]) if done else float("nan"),
+        "llm": sum(count for path, count in requests.items() if path.endswith("/chat/completions")) / total,
+        "embed": sum(count for path, count in requests.items() if path.endswith("/embeddings")) / total,
+        "search": sum(requests[provider] for provider in ("naver", "kakao", "google")) / total,
+        "throughput": total / elapsed,
+        "first_error": next((result["error"] for result in results if result["error"]), None),
+    }
+
+
+def main():
+    """
+    This function runs the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS[:-1])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--pdf", help="The PDF of the pdf scenario")
+    parser.add_argument("--dimensions", type=int, default=1536, help="The dimensions of the stub embeddings")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if "pdf" in args.scenarios and not args.pdf:
+        parser.error("the pdf scenario needs --pdf")
+
+    server = StubServer(parse_profiles(args), dimensions=args.dimensions).start()
+    os.environ.update(server.environ())
+    os.environ.update(UNLIMITED)
+    scenarios = load_scenarios(args.pdf)
+
+    print(
+        f"{'scenario':<12} {'sessions':>8} {'turns':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'first ms':>8} {'llm/turn':>8} {'emb/turn':>8} {'srch/turn':>9} {'turns/s':>8}"
+    )
+    try:
+        for name in args.scenarios:
+            for sessions in args.sessions:
+                report = run_scenario(server, scenarios[name], sessions, args.turns)
+                print(
+                    f"{name:<12} {sessions:>8} {report['turns']:>6} {report['errors']:>6} "
+                    f"{report['p50'] * 1000:>8.1f} {report['p95'] * 1000:>8.1f} {report['p99'] * 1000:>8.1f} "
+                    f"{report['first'] * 1000:>8.1f} {report['llm']:>8.2f} {report['embed']:>8.2f} "
+                    f"{report['search']:>9.2f} {report['throughput']:>8.2f}"
+                )
+                if report["first_error"]:
+                    print(f"    first error: {report['first_error']}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+This benchmark compares the serial and the multi-process PDF text extraction.
+
+Usage:
+    python -m benchmarks.pdf_extraction report.pdf --workers 2 4 8 --repeat 3
+"""
+
+import argparse
+import time
+
+from common.pdf_ingest import iter_pages
+
+
+def time_extraction(pdf_path: str, workers: int, repeat: int) -> float:
+    """
+    This function returns the best time to extract every page of the PDF.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        workers (int): The number of worker processes, 1 for the serial path.
+        repeat (int): The number of runs.
+
+    Returns:
+        float: The best time in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in iter_pages(pdf_path, workers=workers):
+            pass
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    """
+    This function runs the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_path")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = list(iter_pages(args.pdf_path, workers=1))
+    for workers in args.workers:
+        if list(iter_pages(args.pdf_path, workers=workers)) != pages:
+            raise RuntimeError(f"Parallel extraction with {workers} workers differs from the serial one")
+
+    serial = time_extraction(args.pdf_path, 1, args.repeat)
+    print(f"{len(pages)} pages")
+    print(f"{'workers':>8} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+    print(f"{1:>8} {serial:>9.3f} {len(pages) / serial:>9.1f} {1.0:>8.2f}")
+    for workers in args.workers:
+        elapsed = time_extraction(args.pdf_path, workers, args.repeat)
+        print(f"{workers:>8} {elapsed:>9.3f} {len(pages) / elapsed:>9.1f} {serial / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+This benchmark measures the cold start and the per-rerun overhead of the Streamlit pages.
+
+Cold start is the time a fresh interpreter takes to import the modules of a page.
+Per-rerun overhead is the time Streamlit takes to re-execute a page script without user input,
+with an empty conversation and with long ones.
+No OpenAI, search or YouTube request is sent, and the conversations are stored in a temporary database.
+
+Usage:
+    python -m benchmarks.rerun_cost --reruns 20 --history 0 200 1000
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from streamlit.testing.v1 import AppTest
+
+from settings import root_dir
+from common.conversation_store import conversations
+
+PAGES = {
+    "app_pages/my_chat_bot.py": "common.chat",
+    "app_pages/ask_with_search.py": "common.ask_with_search",
+    "app_pages/ask_to_youtube.py": "common.ask_for_youtube",
+}
+
+
+def cold_import(module: str, repeat: int) -> float:
+    """
+    This function returns the median time a fresh interpreter takes to import a module.
+
+    Args:
+        module (str): The module to import.
+        repeat (int): The number of interpreters to start.
+
+    Returns:
+        float: The median import time in seconds, without the interpreter startup.
+    """
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=root_dir, capture_output=True, text=True, check=True
+        ).stdout
+        times.append(float(output))
+    return statistics.median(times)
+
+
+def synthetic_history(messages: int) -> list:
+    """
+    This function returns a conversation of alternating user and assistant messages.
+
+    Args:
+        messages (int): The number of messages.
+
+    Returns:
+        list[dict]: The messages.
+    """
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} with **some** markdown text. " * 8}
+        for i in range(messages)
+    ]
+
+
+def rerun_time(page: str, reruns: int, history: int = 0) -> float:
+    """
+    This function returns the median time Streamlit takes to rerun a page.
+
+    Args:
+        page (str): The path of the page script, relative to the app directory.
+        reruns (int): The number of reruns.
+        history (int): The number of messages in the conversation of the page.
+
+    Returns:
+        float: The median rerun time in seconds.
+    """
+    app = AppTest.from_file(os.path.join(root_dir, page), default_timeout=60)
+    app.run()
+    if history:
+        state = app.session_state
+        messages = state["chat"].history if "chat" in state else state["chat_history"]
+        messages.extend(synthetic_history(history))
+        app.run()
+    times = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    """
+    This function runs the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 200], help="Messages in the conversation")
+    args = parser.parse_args()
+
+    # The pages build clients on import, which only needs a key to be set
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    print(f"{'page':<32} {'cold import ms':>15} " + " ".join(f"{f'rerun ms @{n}':>14}" for n in args.history))
+    with tempfile.TemporaryDirectory() as directory:
+        # The pages run in this process, so they share the store of this module
+        conversations.database.path = os.path.join(directory, "conversations.sqlite3")
+        for page, module in PAGES.items():
+            cold = cold_import(module, args.repeat)
+            reruns = [rerun_time(page, args.reruns, history) for history in args.history]
+            print(f"{page:<32} {cold * 1000:>15.1f} " + " ".join(f"{rerun * 1000:>14.1f}" for rerun in reruns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+This benchmark compares the previous handling of the search responses with the SearchResult records.
+
+The previous path stripped <b> over the whole JSON text, then kept the title, snippet, url and date
+of every item in a dict, leaving the entities encoded. The new path strips the tags and decodes
+the entities of the kept fields only, into a slotted SearchResult.
+It reports the parse time per response, the memory retained per result and the prompt tokens per result.
+No request is sent: the responses are synthetic, with the extra fields the providers return.
+
+Usage:
+    python -m benchmarks.search_result --items 10 --repeat 2000
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from common.search_result import parse_results
+from common.tokens import count_tokens
+
+SNIPPET = (
+    "<b>검색어</b>에 대한 최신 소식과 &quot;핵심 내용&quot;을 정리했습니다. "
+    "The latest &amp; most relevant <b>news</b> about the topic, with details &lt;and&gt; context."
+)
+
+
+def synthetic_responses(items: int) -> Dict[str, str]:
+    """
+    This function returns a raw JSON response of each provider.
+
+    Args:
+        items (int): The number of items per response.
+
+    Returns:
+        dict: The JSON text of the Naver, Kakao and Google responses.
+    """
+    naver = {
+        "lastBuildDate": "Mon, 01 Jan 2024 09:00:00 +0900",
+        "total": 12345,
+        "start": 1,
+        "display": items,
+        "items": [
+            {
+                "title": f"<b>검색어</b> 기사 제목 {i}",
+                "originallink": f"https://news.example.com/{i}",
+                "link": f"https://n.news.naver.com/article/{i}",
+                "description": SNIPPET,
+                "bloggername": "블로거",
+                "bloggerlink": "https://blog.naver.com/someone",
+                "pubDate": "Mon, 01 Jan 2024 09:00:00 +0900",
+            }
+            for i in range(items)
+        ],
+    }
+    kakao = {
+        "meta": {"total_count": 12345, "pageable_count": 800, "is_end": False},
+        "documents": [
+            {
+                "title": f"<b>검색어</b> 블로그 글 {i}",
+                "contents": SNIPPET,
+                "url": f"https://blog.example.com/{i}",
+                "blogname": "블로그",
+                "thumbnail": f"https://search.pstatic.net/thumb/{i}.jpg",
+                "datetime": "2024-01-01T09:00:00.000+09:00",
+            }
+            for i in range(items)
+        ],
+    }
+    google = {
+        "kind": "customsearch#search",
+        "items": [
+            {
+                "kind": "customsearch#result",
+                "title": f"검색어 page {i}",
+                "htmlTitle": f"<b>검색어</b> page {i}",
+                "link": f"https://www.example.com/{i}",
+                "displayLink": "www.example.com",
+                "snippet": SNIPPET,
+                "htmlSnippet": SNIPPET,
+                "formattedUrl": f"https://www.example.com/{i}",
+                "pagemap": {
+                    "cse_thumbnail": [{"src": f"https://encrypted-tbn0.gstatic.com/{i}", "width": "225"}],
+                    "metatags": [{"og:type": "article", "article:published_time": "2024-01-01T09:00:00+09:00"}],
+                },
+            }
+            for i in range(items)
+        ],
+    }
+    return {"naver": json.dumps(naver), "kakao": json.dumps(kakao), "google": json.dumps(google)}
+
+
+def previous_path(source: str, text: str) -> List[dict]:
+    """
+    This function handles a response as before SearchResult: a blanket <b> strip, then a dict per item.
+    """
+    response = json.loads(text.replace("<b>", "").replace("</b>", ""))
+    items = response.get("documents") if source == "kakao" else response.get("items")
+    compact = []
+    for item in items or []:
+        entry = {
+            "title": item.get("title") or "",
+            "snippet": item.get("description") or item.get("contents") or item.get("snippet") or "",
+            "url": item.get("link") or item.get("url") or "",
+        }
+        date = item.get("pubDate") or item.get("postdate") or item.get("datetime")
+        if date:
+            entry["date"] = date
+        compact.append(entry)
+    return compact
+
+
+def raw_path(source: str, text: str) -> List[dict]:
+    """
+    This function handles a response as the original prompt did: every field of every item.
+    """
+    response = json.loads(text.replace("<b>", "").replace("</b>", ""))
+    return list((response.get("documents") if source == "kakao" else response.get("items")) or [])
+
+
+def new_path(source: str, text: str) -> list:
+    """
+    This function parses a response into SearchResult records.
+    """
+    return parse_results(source, json.loads(text))
+
+
+def measure(handle: Callable[[str, str], list], responses: Dict[str, str], repeat: int) -> dict:
+    """
+    This function measures a path on the responses of every provider.
+
+    Args:
+        handle (Callable): The path, taking the provider and the JSON text.
+        responses (dict): The JSON text of each provider.
+        repeat (int): The number of runs for the timing.
+
+    Returns:
+        dict: The microseconds per response, the bytes retained per result and the prompt tokens per result.
+    """
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for source, text in responses.items():
+            handle(source, text)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [handle(source, text) for source, text in responses.items()]
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    results = [result for batch in kept for result in batch]
+    prompt = [result if isinstance(result, dict) else result.to_prompt() for result in results]
+    return {
+        "us": elapsed / (repeat * len(responses)) * 1e6,
+        "bytes": retained / len(results),
+        "tokens": count_tokens(json.dumps(prompt, ensure_ascii=False)) / len(results),
+    }
+
+
+def main():
+    """
+    This function runs the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    responses = synthetic_responses(args.items)
+    print(f"{'path':<12} {'us/response':>12} {'bytes/result':>13} {'tokens/result':>14}")
+    for name, handle in (("raw", raw_path), ("previous", previous_path), ("SearchResult", new_path)):
+        report = measure(handle, responses, args.repeat)
+        print(f"{name:<12} {report['us']:>12.1f} {report['bytes']:>13.0f} {report['tokens']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
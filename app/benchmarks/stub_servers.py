@@ -0,0 +1,443 @@
+"""
+This module provides a local stand-in HTTP server for the OpenAI and search APIs.
+
+One server answers the OpenAI chat completions and embeddings endpoints and the Naver, Kakao
+and Google search endpoints under a path prefix per provider, with a configurable latency,
+jitter and error rate per provider. Point the clients at it with the *_BASE_URL settings,
+see StubServer.environ.
+
+Usage:
+    python -m benchmarks.stub_servers --port 8089 --latency openai=0.4 --error-rate naver=0.05
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+PROVIDERS = ("openai", "naver", "kakao", "google")
+
+# Answers of the one-word classifier prompts, looked up by a phrase of the prompt
+CLASSIFIER_REPLIES = (
+    ('Write "WRITE_EMAIL"', "QUESTION"),
+    ("If you can answer the question: ANSWER", "ANSWER"),
+    ("need for video search", "FALSE"),
+)
+
+# Values of the structured outputs, by property name, so every engine takes its longest path.
+# The web service is the default of SPECULATIVE_SERVICE_TYPE, so speculative searches are used
+SCHEMA_VALUES = {"need_search": True, "sorting_type": "SIMILARITY", "service_type": "WEBKR", "state": "ANSWER"}
+
+SCALAR_VALUES = {"boolean": True, "integer": 1, "number": 1.0, "null": None}
+
+LOREM = (
+    "The quick brown fox jumps over the lazy dog while the search results describe the latest news "
+    "about the question and the assistant summarizes the key points in a clear and concise answer"
+).split()
+
+
+@dataclass
+class StubProfile:
+    """
+    This class is a data class for the behavior of a stand-in provider.
+
+    Attributes:
+        latency (float): The median seconds before the response.
+        jitter (float): The standard deviation of the latency in seconds.
+        error_rate (float): The fraction of requests answered with a 500 error.
+        chunk_delay (float): The seconds between two streamed chunks.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    chunk_delay: float = 0.0
+
+    def delay(self, rng: random.Random) -> float:
+        """
+        This method draws the latency of one request.
+        """
+        return max(0.0, rng.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+
+
+def text(words: int, seed: str) -> str:
+    """
+    This function returns a deterministic pseudo-sentence.
+
+    Args:
+        words (int): The number of words.
+        seed (str): The seed of the words.
+
+    Returns:
+        str: The text.
+    """
+    start = int(hashlib.md5(seed.encode("utf-8")).hexdigest(), 16) % len(LOREM)
+    return " ".join(LOREM[(start + i) % len(LOREM)] for i in range(words))
+
+
+def schema_value(schema: dict, name: str = "", seed: str = ""):
+    """
+    This function builds a value valid for a strict JSON schema.
+
+    Args:
+        schema (dict): The JSON schema.
+        name (str): The name of the property holding the value.
+        seed (str): The seed of the generated texts.
+
+    Returns:
+        The value.
+    """
+    if "anyOf" in schema:
+        options = schema["anyOf"]
+        schema = next((option for option in options if option.get("type") == "null"), options[0])
+    kind = schema.get("type")
+    if name in SCHEMA_VALUES:
+        value = SCHEMA_VALUES[name]
+    elif "enum" in schema:
+        value = schema["enum"][0]
+    elif kind == "object":
+        value = {key: schema_value(item, key, seed) for key, item in schema.get("properties", {}).items()}
+    elif kind == "array":
+        value = [schema_value(schema.get("items", {}), name, seed)]
+    elif kind == "string":
+        value = text(40 if name == "reply" else 6, seed + name)
+    else:
+        value = SCALAR_VALUES.get(kind)
+    return value
+
+
+def embedding(value, dimensions: int) -> list:
+    """
+    This function returns a deterministic unit embedding of an input.
+
+    Args:
+        value: The text or tokens to embed.
+        dimensions (int): The number of dimensions.
+
+    Returns:
+        list: The embedding.
+    """
+    seed = int(hashlib.md5(json.dumps(value).encode("utf-8")).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    This class answers the requests of the stand-in server.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        This method answers the search endpoints.
+        """
+        url = urlparse(self.path)
+        provider = url.path.strip("/").split("/")[0]
+        if provider not in ("naver", "kakao", "google"):
+            self._error(404)
+            return
+        if not self._admit(provider, url.path):
+            return
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        query = params.get("query") or params.get("q") or ""
+        count = int(params.get("display") or params.get("size") or 10)
+        date = time.strftime("%a, %d %b %Y %H:%M:%S +0900")
+        items = [
+            {"title": f"<b>{query}</b> {text(5, query + str(i))}", "url": f"https://example.com/{provider}/{i}"}
+            for i in range(count)
+        ]
+        if provider == "naver":
+            body = {
+                "lastBuildDate": date,
+                "items": [
+                    {"title": item["title"], "link": item["url"], "description": text(30, item["url"]), "pubDate": date}
+                    for item in items
+                ],
+            }
+        elif provider == "kakao":
+            body = {
+                "documents": [
+                    {"title": item["title"], "url": item["url"], "contents": text(30, item["url"]), "datetime": date}
+                    for item in items
+                ]
+            }
+        else:
+            body = {
+                "items": [
+                    {"title": item["title"], "link": item["url"], "snippet": text(30, item["url"])} for item in items
+                ]
+            }
+        self._json(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        This method answers the OpenAI endpoints.
+        """
+        path = urlparse(self.path).path
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if not path.startswith("/openai/"):
+            self._error(404)
+            return
+        if not self._admit("openai", path):
+            return
+        if path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif path.endswith("/chat/completions"):
+            self._completion(body)
+        else:
+            self._error(404)
+
+    def _admit(self, provider: str, path: str) -> bool:
+        profile = self.server.profiles[provider]
+        with self.server.lock:
+            self.server.requests[provider] += 1
+            self.server.requests[path] += 1
+            delay = profile.delay(self.server.rng)
+            failed = self.server.rng.random() < profile.error_rate
+        time.sleep(delay)
+        if failed:
+            with self.server.lock:
+                self.server.requests[f"{provider}:errors"] += 1
+            self._error(500)
+            return False
+        return True
+
+    def _embeddings(self, body: dict):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        if inputs and isinstance(inputs[0], int):
+            inputs = [inputs]
+        self._json(
+            {
+                "object": "list",
+                "model": body["model"],
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": embedding(value, self.server.dimensions)}
+                    for i, value in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": len(json.dumps(inputs)) // 4, "total_tokens": len(json.dumps(inputs)) // 4},
+            }
+        )
+
+    def _completion(self, body: dict):
+        prompt = str(body["messages"][-1].get("content") or "")
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            content = json.dumps(schema_value(response_format["json_schema"]["schema"], seed=prompt))
+        else:
+            content = next((reply for phrase, reply in CLASSIFIER_REPLIES if phrase in prompt), None)
+            content = content or text(60, prompt)
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content") or "")) for m in body["messages"]) // 4,
+            "completion_tokens": len(content) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if body.get("stream"):
+            self._stream(body, content, usage)
+            return
+        self._json(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                ],
+                "usage": usage,
+            }
+        )
+
+    def _stream(self, body: dict, content: str, usage: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time())}
+        chunk["model"] = body["model"]
+        for piece in pieces(content):
+            choice = {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+            self._chunk(f"data: {json.dumps({**chunk, 'choices': [choice]})}\n\n")
+            time.sleep(self.server.profiles["openai"].chunk_delay)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._chunk(f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage})}\n\n")
+        self._chunk("data: [DONE]\n\n")
+        self._chunk("")
+
+    def _chunk(self, data: str):
+        raw = data.encode("utf-8")
+        self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, body: dict, status: int = 200):
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _error(self, status: int):
+        self._json({"error": {"message": "Injected error", "type": "server_error"}}, status)
+
+
+def pieces(content: str, size: int = 4) -> Iterator[str]:
+    """
+    This function splits a text into the small pieces of a streamed completion.
+    """
+    for start in range(0, len(content), size):
+        yield content[start : start + size]
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    This class is the stand-in server, running in a daemon thread.
+
+    Attributes:
+        profiles (dict): The StubProfile of each provider.
+        dimensions (int): The number of dimensions of the embeddings.
+        requests (Counter): The number of requests by provider, by path and of injected errors.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        profiles: Dict[str, StubProfile] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dimensions: int = 1536,
+        seed: int = 0,
+    ):
+        super().__init__((host, port), StubHandler)
+        self.profiles = {provider: StubProfile() for provider in PROVIDERS}
+        self.profiles.update(profiles or {})
+        self.dimensions = dimensions
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        The base URL of the server.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self) -> Dict[str, str]:
+        """
+        This method returns the environment variables pointing the clients at the server.
+
+        Returns:
+            dict: The base URLs and dummy credentials of every provider.
+        """
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/openai/v1",
+            "NAVER_BASE_URL": f"{self.url}/naver/v1/search",
+            "KAKAO_BASE_URL": f"{self.url}/kakao",
+            "GOOGLE_BASE_URL": f"{self.url}/google/customsearch/v1",
+            "OPENAI_API_KEY": "stub",
+            "NAVER_CLIENT_ID": "stub",
+            "NAVER_CLIENT_SECRET": "stub",
+            "KAKAO_API_KEY": "stub",
+            "GOOGLE_CX": "stub",
+            "GOOGLE_KEY": "stub",
+        }
+
+    def snapshot(self) -> Counter:
+        """
+        This method returns a copy of the request counters.
+        """
+        with self.lock:
+            return Counter(self.requests)
+
+    def handle_error(self, request, client_address):
+        """
+        This method ignores the clients closing their keep-alive connections.
+        """
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self) -> "StubServer":
+        """
+        This method serves the requests in a daemon thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        This method stops the server.
+        """
+        self.shutdown()
+        self.server_close()
+
+
+def parse_profiles(args: argparse.Namespace) -> Dict[str, StubProfile]:
+    """
+    This function builds the profiles of the providers from the command line arguments.
+
+    Args:
+        args (argparse.Namespace): The arguments with latency, jitter, error_rate and chunk_delay lists.
+
+    Returns:
+        dict: The StubProfile of each provider.
+    """
+    profiles = {provider: StubProfile() for provider in PROVIDERS}
+    for field in ("latency", "jitter", "error_rate", "chunk_delay"):
+        for value in getattr(args, field) or []:
+            name, _, number = value.rpartition("=")
+            for provider in [name] if name else PROVIDERS:
+                setattr(profiles[provider], field, float(number))
+    return profiles
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """
+    This function adds the arguments of the provider profiles to a parser.
+    Each takes `provider=value`, or a bare value for every provider.
+    """
+    parser.add_argument("--latency", action="append", help="e.g. openai=0.4 or 0.1")
+    parser.add_argument("--jitter", action="append", help="e.g. naver=0.05")
+    parser.add_argument("--error-rate", dest="error_rate", action="append", help="e.g. kakao=0.02")
+    parser.add_argument("--chunk-delay", dest="chunk_delay", action="append", help="e.g. openai=0.01")
+
+
+def main():
+    """
+    This function runs the stand-in server from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubServer(parse_profiles(args), port=args.port)
+    for name, value in server.environ().items():
+        print(f"export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@
 This file is used to ask a question to a youtube video.
 """
 
-from typing import Iterable, List
+from typing import Iterable, Iterator, List, Union
 from urllib.parse import urlparse, parse_qs
 
-from youtube_transcript_api import YouTubeTranscriptApi
-
-from common.client import OpenAIClient
+from settings import transcript_top_k
+from common.client import get_openai_client
+from common.history import HistoryWindow
+from common.metrics import timed
+from common.transcript_index import TranscriptIndexCache
 
 
 def get_youtube_video_id_from_url(url: str) -> str:
@@ -37,35 +39,47 @@ def get_youtube_transcript(video_id: str, languages: Iterable[str] = ("ko",)) ->
     Returns:
         List[dict]: The transcript of the youtube video.
     """
-    return YouTubeTranscriptApi.get_transcript(video_id, languages=languages)
+    # Imported here so only the pages asking YouTube pay for it
+    from youtube_transcript_api import YouTubeTranscriptApi  # pylint: disable=import-outside-toplevel
+
+    with timed("youtube.transcript"):
+        return YouTubeTranscriptApi.get_transcript(video_id, languages=languages)
+
+
+transcript_indexes = TranscriptIndexCache(get_youtube_transcript)
 
 
-def get_answer_in_youtube(video_id: str, question: str, history=None) -> str:
+def get_answer_in_youtube(
+    video_id: str, question: str, history=None, stream: bool = False, window: HistoryWindow = None
+) -> Union[str, Iterator[str]]:
     """
     This function is used to get the summary of a youtube video.
 
     Args:
         video_id: str: The id of the youtube video.
         question: str: The question to ask the youtube video.
+        history: list: The previous chat messages.
+        stream: bool: Whether to return the answer as a stream of text pieces.
+        window: HistoryWindow: The token budget window of the conversation (default: a new window).
     Returns:
-        str: The summary of the youtube video.
+        str | Iterator[str]: The summary of the youtube video.
     """
     if history is None:
         history = []  # Initialize history as an empty list if None
 
     if video_id:
-        transcript = get_youtube_transcript(video_id)
-        text_list = [f"{t.get('start')}s: {t.get('text')}" for t in transcript]
-        text = " ".join(text_list)
+        chunks = transcript_indexes.get(video_id).query(question, transcript_top_k)
+        text = "\n".join(chunk.to_prompt() for chunk in chunks)
     else:
         text = None
 
-    client = OpenAIClient()
+    client = get_openai_client()
 
     prompt_role = """
         You are a helpful assistant.
         When the TRANSCRIPT is unavailable, you should respond to the user's inquiry. 
         If a TRANSCRIPT of a YouTube video is provided, you should address the user's questions related to that video.
+        The TRANSCRIPT contains the parts of the video most relevant to the question, each with its [start-end] time.
         When a user asks, 'What can you do?', respond with: 'If you are provided with a YouTube video URL, I can answer questions based on that video.
         The answer is not politcal. You have to answer friendly.
     """
@@ -75,4 +89,7 @@ def get_answer_in_youtube(video_id: str, question: str, history=None) -> str:
         TRANSCRIPT: {text}
         USER: {question}
     """
-    return client.chat(history + [{"role": "user", "content": prompt}])
+    messages = (window or HistoryWindow()).fit(history) + [{"role": "user", "content": prompt}]
+    if stream:
+        return client.chat_stream(messages)
+    return client.chat(messages)
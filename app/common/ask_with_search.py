@@ -5,55 +5,189 @@ and to facilitate chat responses based on search results.
 
 from datetime import datetime
 
+from settings import search_speculation, speculative_service_type
 from common.client import (
     NaverAPIClient,
-    OpenAIClient,
     KakaoAPIClient,
     GoogleAPIClient,
-    get_sorting_type,
+    SearchPlan,
+    get_openai_client,
     is_need_search,
+    plan_search,
 )
+from common.fan_out import FanOut, fan_out
+from common.history import HistoryWindow
+from common.metrics import timed, speculations, speculation_wasted
+from common.rerank import rerank_items
+from common.search_result import parse_results
 
 
-def chat_with_search(question, history=None):
+def search_tasks(question, plan):
+    """
+    This function builds the provider searches for the user's question.
+
+    Args:
+        question (str): The question asked by the user.
+        plan (SearchPlan): The search plan for the question.
+
+    Returns:
+        dict: The search callables, by provider.
+    """
+    naver_client = NaverAPIClient()
+    kakao_client = KakaoAPIClient()
+    google_client = GoogleAPIClient()
+
+    if plan.sorting_type == "LATEST":
+        return {
+            "naver": lambda: naver_client.search(query=question, sort="date", plan=plan),
+            "kakao": lambda: kakao_client.search(query=question, sort="recency", plan=plan),
+        }
+    return {
+        "naver": lambda: naver_client.search(query=question, plan=plan),
+        "kakao": lambda: kakao_client.search(query=question, plan=plan),
+        "google": lambda: google_client.search(query=question, plan=plan),
+    }
+
+
+def collect_sources(question, searches):
+    """
+    This function merges and reranks the provider searches for the user's question.
+
+    Args:
+        question (str): The question asked by the user.
+        searches (FanOutResult): The provider searches.
+
+    Returns:
+        dict: The search time, the most relevant search results and the sources that did not answer in time.
+    """
+    results = [
+        result
+        for source in ("naver", "kakao", "google")
+        for result in parse_results(source, searches.results.get(source))
+    ]
+    return {
+        "search time": (searches.results.get("naver") or {}).get("lastBuildDate"),
+        "items": [result.to_prompt() for result in rerank_items(question, results)],
+        "unavailable sources": searches.timed_out + list(searches.errors),
+    }
+
+
+def search_sources(question, plan):
+    """
+    This function searches Naver, Kakao and Google at once for the user's question.
+
+    Args:
+        question (str): The question asked by the user.
+        plan (SearchPlan): The search plan for the question.
+
+    Returns:
+        dict: The search time, the most relevant search results and the sources that did not answer in time.
+    """
+    return collect_sources(question, fan_out(search_tasks(question, plan)))
+
+
+def speculative_plan(question):
+    """
+    This function returns the plan of a search started before the question is classified:
+    the raw question with the default sort on the settings.speculative_service_type service.
+
+    Args:
+        question (str): The question asked by the user.
+
+    Returns:
+        SearchPlan: The speculative search plan.
+    """
+    return SearchPlan(
+        need_search=True,
+        sorting_type="SIMILARITY",
+        service_type=speculative_service_type,
+        naver_query=question,
+        kakao_query=question,
+        google_query=question,
+    )
+
+
+def classify(question):
+    """
+    This function returns the search plan for the user's question, or None if no search is needed.
+
+    An exact cached answer of is_need_search needs no call. Otherwise the planner call starts first,
+    so the embedding of the semantic lookup runs alongside it instead of before it. When the lookup
+    answers that no search is needed, the planner call is dropped and finishes in the background.
+
+    Args:
+        question (str): The question asked by the user.
+
+    Returns:
+        SearchPlan: The search plan, or None.
+    """
+    need_search = is_need_search.cached(question)
+    if need_search is None:
+        planning = FanOut({"plan": lambda: plan_search(question)})
+        need_search = is_need_search(question)
+        if need_search != "TRUE":
+            planning.cancel()
+    if need_search != "TRUE":
+        return None
+    # The planner call in flight is shared by plan_search
+    return plan_search(question)
+
+
+def discard(speculation, outcome):
+    """
+    This function drops a speculative search, cancelling the provider searches that have not started.
+
+    Args:
+        speculation (FanOut): The speculative searches.
+        outcome (str): Why the searches are dropped, 'no_search', 'resorted' or 'mismatch'.
+    """
+    speculations.inc(outcome=outcome)
+    for provider in speculation.cancel():
+        speculation_wasted.inc(provider=provider)
+
+
+def chat_with_search(question, history=None, stream=False, window=None, speculate=None):
     """
     This function interacts with the Naver API to perform a search based on the user's question
     and formulates a response using the search results.
 
+    With speculation, the provider searches for the raw question start with the default sort while
+    the question is classified. They are used if a search is needed with the same sort on the same
+    service, and discarded otherwise.
+
     Args:
         question (str): The question asked by the user.
         history (list): A list of previous chat messages (default is an empty list).
+        stream (bool): Whether to return the response as a stream of text pieces (default is False).
+        window (HistoryWindow): The token budget window of the conversation (default is a new window).
+        speculate (bool): Whether to search during the classification (default: settings.search_speculation).
 
     Returns:
-        str: The response generated based on the search results and user question.
+        str | Iterator[str]: The response generated based on the search results and user question.
     """
     if history is None:
         history = []  # Initialize history as an empty list if None
 
-    openai_client = OpenAIClient()
-    naver_client = NaverAPIClient()
-    kakao_client = KakaoAPIClient()
-    google_client = GoogleAPIClient()
+    openai_client = get_openai_client()
+
+    speculate = search_speculation if speculate is None else speculate
+    speculation = FanOut(search_tasks(question, speculative_plan(question))) if speculate else None
 
     real_search = None
-    if is_need_search(question) == "TRUE":
-        sorting_type = get_sorting_type(question)
-        if sorting_type == "LATEST":
-            naver_search = naver_client.search(query=question, sort="date")
-            kakao_search = kakao_client.search(query=question, sort="recency")
-            google_search = None
-        else:
-            naver_search = naver_client.search(query=question)
-            kakao_search = kakao_client.search(query=question)
-            google_search = google_client.search(query=question)
-        real_search = {
-            "search time": naver_search.get("lastBuildDate"),
-            "items": (
-                list(naver_search.get("items"))
-                + list(kakao_search.get("documents"))
-                + (list(google_search.get("items")) if google_search else [])
-            ),
-        }
+    with timed("search_turn.classify"):
+        plan = classify(question)
+    if plan is None:
+        if speculation is not None:
+            discard(speculation, "no_search")
+    elif speculation is not None and (plan.sorting_type, plan.service_type) == ("SIMILARITY", speculative_service_type):
+        speculations.inc(outcome="hit")
+        with timed("search_turn.search"):
+            real_search = collect_sources(question, speculation.wait())
+    else:
+        if speculation is not None:
+            discard(speculation, "resorted" if plan.sorting_type != "SIMILARITY" else "mismatch")
+        with timed("search_turn.search"):
+            real_search = search_sources(question, plan)
 
     prompt_role = f"""
         You are a helpful assistant.
@@ -74,4 +208,8 @@ def chat_with_search(question, history=None):
             {real_search}
         USER: {question}
     """
-    return openai_client.chat(history + [{"role": "user", "content": prompt}])
+    with timed("search_turn.history"):
+        messages = (window or HistoryWindow()).fit(history) + [{"role": "user", "content": prompt}]
+    if stream:
+        return openai_client.chat_stream(messages)
+    return openai_client.chat(messages)
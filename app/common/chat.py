@@ -2,9 +2,17 @@
 This is an example of how to use the OpenAI API to ask a question using a microphone.
 """
 
-from typing import List
+import json
+import logging
+import re
+from typing import Iterator, List
 
-from common.client import OpenAIClient
+from settings import chat_structured_dispatch
+from common.client import OpenAIClient, get_openai_client
+from common.history import HistoryWindow
+from common.metrics import chat_actions
+
+logger = logging.getLogger(__name__)
 
 
 STARTING_PROMPT = """
@@ -64,6 +72,114 @@ prompts = {
 
 actions = ["ACTION_WRITE_EMAIL"]
 
+# States whose prompt makes the model write the reply to the user instead of a state
+reply_states = ["ANSWER", "MORE", "OTHER", "ACTION_WRITE_EMAIL", "EXIT"]
+
+DISPATCH_PROMPT = """
+    [INSTRUCTION]
+        Decide the STATE of the conversation after the last user message and write your REPLY to the user.
+        - "ANSWER": the user has a precise question you can answer. Answer it.
+        - "MORE": you need more information, e.g. the subject, recipient or message of an email. Ask for it.
+        - "OTHER": polite conversation or something you cannot answer or do. Answer politely or say you cannot.
+        - "ACTION_WRITE_EMAIL": the user wants to send an email and you have its subject, recipient and message.
+          Fill in "email" and tell the user the email has been sent.
+        - "EXIT": the user wants to end the conversation. Tell the user the conversation is ended very politely.
+        Set "email" to null unless the state is "ACTION_WRITE_EMAIL".
+"""
+
+DISPATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "state": {"type": "string", "enum": reply_states},
+        "email": {
+            "anyOf": [
+                {
+                    "type": "object",
+                    "properties": {
+                        "subject": {"type": "string"},
+                        "recipient": {"type": "string"},
+                        "message": {"type": "string"},
+                    },
+                    "required": ["subject", "recipient", "message"],
+                    "additionalProperties": False,
+                },
+                {"type": "null"},
+            ]
+        },
+        # The reply comes last, so it can be streamed once the state and the email are known
+        "reply": {"type": "string"},
+    },
+    "required": ["state", "email", "reply"],
+    "additionalProperties": False,
+}
+
+
+class _ReplyStreamer:
+    """
+    This class extracts the "reply" string of a streamed JSON object as it arrives.
+    """
+
+    def __init__(self, field: str = "reply"):
+        self.buffer = ""
+        self._field = re.compile(rf'"{field}"\s*:\s*"')
+        self._start = None  # index of the first character of the string in the buffer
+        self._safe = 0  # decoded length of the string, relative to _start
+        self._done = False
+
+    def _safe_end(self, raw: str) -> int:
+        i = self._safe
+        while i < len(raw):
+            char = raw[i]
+            if char == '"':
+                self._done = True
+                return i
+            if char == "\\":
+                # Never split an escape sequence or a surrogate pair
+                length = 2
+                if raw[i + 1 : i + 2] == "u":
+                    length = 6
+                    if len(raw) >= i + 6 and 0xD800 <= int(raw[i + 2 : i + 6], 16) <= 0xDBFF:
+                        length = 12
+                if i + length > len(raw):
+                    return i
+                i += length
+            else:
+                i += 1
+        return i
+
+    def feed(self, chunk: str) -> str:
+        """
+        This method adds a piece of the JSON output and returns the new text of the reply.
+
+        Args:
+            chunk: The piece of the JSON output.
+
+        Returns:
+            The decoded reply text that arrived with the piece.
+        """
+        self.buffer += chunk
+        if self._start is None:
+            match = self._field.search(self.buffer)
+            if match is None:
+                return ""
+            self._start = match.end()
+        if self._done:
+            return ""
+        raw = self.buffer[self._start :]
+        end = self._safe_end(raw)
+        text = json.loads(f'"{raw[self._safe:end]}"')
+        self._safe = end
+        return text
+
+    def result(self) -> dict:
+        """
+        This method parses the whole JSON output once the stream is exhausted.
+
+        Returns:
+            The JSON object.
+        """
+        return json.loads(self.buffer)
+
 
 class Chat:
     """
@@ -74,25 +190,28 @@ class Chat:
         self,
         state: str = "START",
         history: List[dict] = None,
+        structured: bool = chat_structured_dispatch,
+        client: OpenAIClient = None,
     ) -> None:
+        self.structured = structured
         self.previous_state = None
         self.state = state
-        self.history = (
-            history
-            if history is not None
-            else [
-                {"role": "system", "content": STARTING_PROMPT},
-            ]
-        )
-        self.client = OpenAIClient()
+        self.history = history if history is not None else []
+        if not self.history:
+            self.history.append({"role": "system", "content": STARTING_PROMPT})
+        self.client = client or get_openai_client()
+        self.window = HistoryWindow(client=self.client)
 
     def reset(self):
         """
         This function is used to reset the chat.
+        The history is cleared in place, so a stored history starts a new conversation.
         """
         self.previous_state = None
         self.state = "START"
-        self.history = [{"role": "system", "content": STARTING_PROMPT}]
+        self.history.clear()
+        self.history.append({"role": "system", "content": STARTING_PROMPT})
+        self.window.reset()
 
     def reset_to_previous_state(self):
         """
@@ -121,7 +240,8 @@ class Chat:
         Returns:
             The result of the action.
         """
-        print(f"DEBUG perform action={action}")
+        logger.info("perform action=%s", action)
+        chat_actions.inc(action=action)
 
     def discuss(self, user_input: str = None) -> str:
         """
@@ -133,23 +253,56 @@ class Chat:
         Returns:
             The response of the conversation.
         """
+        return "".join(self.discuss_stream(user_input))
+
+    def discuss_stream(self, user_input: str = None) -> Iterator[str]:
+        """
+        This function is used to continue the conversation, streaming the response.
+        The history is updated once the stream is exhausted.
+
+        With structured dispatch, one structured completion returns the next state, the email
+        of ACTION_WRITE_EMAIL and the reply. Otherwise, the state machine classifies the state
+        with a call per transition before the reply.
+
+        Args:
+            user_input: The user input. If None, just use the action prompts.
+
+        Returns:
+            The pieces of the response of the conversation.
+        """
         if user_input:
             self.history.append({"role": "user", "content": user_input})
 
-        complete_messages = self.history + [{"role": "user", "content": prompts[self.state]}]
-        _response = self.client.chat(complete_messages)
+        if self.structured:
+            yield from self._dispatch_structured()
+            return
 
-        # If the response is in prompts, change the state
-        if _response in prompts:
-            self.to_state(_response)
-            return self.discuss()
+        complete_messages = self.window.fit(self.history) + [{"role": "user", "content": prompts[self.state]}]
 
-        # If the response is an action, perform the action
-        if _response.split("|")[0].strip() in actions:
-            action = _response.split("|")[0].strip()
-            self.to_state(action)
-            self.do_action(_response)
-            return self.discuss()
+        if self.state in reply_states:
+            chunks = []
+            for chunk in self.client.chat_stream(complete_messages):
+                chunks.append(chunk)
+                yield chunk
+            _response = "".join(chunks)
+        else:
+            _response = self.client.chat(complete_messages)
+
+            # If the response is in prompts, change the state
+            if _response in prompts:
+                self.to_state(_response)
+                yield from self.discuss_stream()
+                return
+
+            # If the response is an action, perform the action
+            if _response.split("|")[0].strip() in actions:
+                action = _response.split("|")[0].strip()
+                self.to_state(action)
+                self.do_action(_response)
+                yield from self.discuss_stream()
+                return
+
+            yield _response
 
         # If the response is not an action, add it to the history
         self.history.append({"role": "assistant", "content": _response})
@@ -158,4 +311,26 @@ class Chat:
             self.reset()
         else:
             self.reset_to_previous_state()
-        return _response
+
+    def _dispatch_structured(self) -> Iterator[str]:
+        complete_messages = self.window.fit(self.history) + [{"role": "user", "content": DISPATCH_PROMPT}]
+        streamer = _ReplyStreamer()
+        for chunk in self.client.chat_json_stream(complete_messages, "chat_turn", DISPATCH_SCHEMA):
+            text = streamer.feed(chunk)
+            if text:
+                yield text
+        turn = streamer.result()
+
+        self.to_state(turn["state"])
+        if turn["state"] == "ACTION_WRITE_EMAIL" and turn["email"]:
+            email = turn["email"]
+            self.do_action(
+                f"ACTION_WRITE_EMAIL | subject:{email['subject']}, "
+                f"recipient:{email['recipient']}, message:{email['message']}"
+            )
+        self.history.append({"role": "assistant", "content": turn["reply"]})
+
+        if self.state == "EXIT":
+            self.reset()
+        else:
+            self.reset_to_previous_state()
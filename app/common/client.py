@@ -3,55 +3,63 @@ This file is a client for the OpenAI API.
 """
 
 import json
+import threading
+import time
 from dataclasses import dataclass
-from typing import Union, List, Iterable
-
-import yaml
-import requests
+from functools import lru_cache
+from typing import Union, List, Iterable, Iterator, Optional
 
+import numpy as np
 from openai import OpenAI
-from PyPDF2 import PdfReader
-from settings import secret_path
+from settings import (
+    pdf_chunk_tokens,
+    pdf_chunk_overlap,
+    openai_base_url,
+    naver_base_url,
+    kakao_base_url,
+    google_base_url,
+)
+from common.embedding import Embedding
+from common.fan_out import remaining
+from common.metrics import timed, record_usage, cache_lookups, stage_duration, stage_errors
+from common.pdf_ingest import ingest_pdf
+from common.rate_limit import rate_limiter
+from common.search_cache import search_cache, normalize_query
+from common.search_result import clean_text
+from common.secret import get_secret
+from common.semantic_cache import semantic_cached
+from common.single_flight import search_flights, llm_flights
+from common.tokens import count_tokens, count_message_tokens
+from common.transport import get_transport
 
 EMBED_MODEL = "text-embedding-3-small"
 
-
-@dataclass
-class Embedding:
-    """
-    This class is a data class for storing embeddings.
-    """
-
-    id: str
-    vector: List[float]
-    text: str
-
-    def to_dict(self):
-        """
-        This method is used to convert the embedding to a dictionary.
-
-        Args:
-            None
-        Returns:
-            dict: The embedding as a dictionary.
-        """
-        return {"id": self.id, "vector": self.vector, "text": self.text}
+SEARCH_SERVICE_TYPES = {
+    "BLOG": "Blog posts",
+    "NEWS": "News articles",
+    "BOOK": "Books",
+    "ENCYC": "Encyclopedia entries",
+    "CAFEARTICLE": "Cafe posts",
+    "WEBKR": "Web documents",
+    "SHOP": "Shopping items",
+    "DOC": "Professional documents",
+}
 
 
 class OpenAIClient:
     """
     This class is a client for the OpenAI API.
+    Every call waits for its requests and prompt tokens in the shared rate limiter.
     """
 
-    def __init__(self):
-        with open(secret_path, "r", encoding="utf-8") as f:
-            __secret = yaml.safe_load(f)
-        __api_key = __secret["openai"]["api_key"]
+    def __init__(self, api_key: str = None, limiter=rate_limiter):
+        __api_key = api_key or get_secret("openai", "api_key")
 
         if not hasattr(self, "client") or self.client is None:
-            self.client = OpenAI(api_key=__api_key)
+            self.client = OpenAI(api_key=__api_key, base_url=openai_base_url)
 
         self.model = "gpt-4o"
+        self.limiter = limiter
 
     def __del__(self):
         if hasattr(self, "client") and self.client is not None:
@@ -67,12 +75,89 @@ class OpenAIClient:
         Returns:
             str: The response message from the OpenAI API.
         """
-        completion = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-        )
+        completion = self._complete("openai.chat", messages)
         return completion.choices[0].message.content
 
+    def chat_stream(self, messages: List[dict]) -> Iterator[str]:
+        """
+        This method is used to send a message to the OpenAI API and stream the response.
+
+        Args:
+            messages: list[dict]: The messages to send to the OpenAI API.
+        Returns:
+            Iterator[str]: The pieces of the response message as they arrive.
+        """
+        return self._stream("openai.chat_stream", messages)
+
+    def chat_json(self, messages: List[dict], schema_name: str, schema: dict) -> dict:
+        """
+        This method is used to send a message to the OpenAI API and return a structured response.
+
+        Args:
+            messages: list[dict]: The messages to send to the OpenAI API.
+            schema_name: str: The name of the JSON schema.
+            schema: dict: The JSON schema the response has to follow.
+        Returns:
+            dict: The response parsed from the JSON output of the OpenAI API.
+        """
+        completion = self._complete(
+            "openai.chat_json",
+            messages,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "schema": schema, "strict": True},
+            },
+        )
+        return json.loads(completion.choices[0].message.content)
+
+    def chat_json_stream(self, messages: List[dict], schema_name: str, schema: dict) -> Iterator[str]:
+        """
+        This method is used to stream a structured response from the OpenAI API.
+
+        Args:
+            messages: list[dict]: The messages to send to the OpenAI API.
+            schema_name: str: The name of the JSON schema.
+            schema: dict: The JSON schema the response has to follow.
+        Returns:
+            Iterator[str]: The pieces of the JSON output as they arrive.
+        """
+        return self._stream(
+            "openai.chat_json_stream",
+            messages,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "schema": schema, "strict": True},
+            },
+        )
+
+    def _complete(self, stage: str, messages: List[dict], **kwargs):
+        self.limiter.acquire("openai", tokens=count_message_tokens(messages))
+        with timed(stage):
+            completion = self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        record_usage(self.model, completion.usage)
+        return completion
+
+    def _stream(self, stage: str, messages: List[dict], **kwargs) -> Iterator[str]:
+        self.limiter.acquire("openai", tokens=count_message_tokens(messages))
+        start = time.perf_counter()
+        first = True
+        with timed(stage):
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs,
+            )
+            for chunk in stream:
+                if chunk.usage is not None:
+                    record_usage(self.model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        stage_duration.observe(time.perf_counter() - start, stage=f"{stage}.first_token")
+                        first = False
+                    yield chunk.choices[0].delta.content
+
     def embeddings(
         self, text_input: Union[str, List[str], Iterable[int], Iterable[Iterable[int]]], model: str = EMBED_MODEL
     ) -> List[Embedding]:
@@ -90,33 +175,168 @@ class OpenAIClient:
         Returns:
             list[Embedding]: The embeddings for the input.
         """
-        return self.client.embeddings.create(
-            model=model,
-            input=text_input,
-        )
+        if isinstance(text_input, str):
+            tokens = count_tokens(text_input)
+        else:
+            text_input = list(text_input)
+            tokens = sum(
+                count_tokens(item) if isinstance(item, str) else 1 if isinstance(item, int) else len(list(item))
+                for item in text_input
+            )
+        self.limiter.acquire("openai-embeddings", tokens=tokens)
+        with timed("openai.embeddings"):
+            response = self.client.embeddings.create(
+                model=model,
+                input=text_input,
+            )
+        record_usage(model, response.usage)
+        return response
+
+    def unit_embeddings(self, texts: List[str], model: str = EMBED_MODEL) -> np.ndarray:
+        """
+        This method embeds the texts in one batched call and normalizes the vectors,
+        so their dot products are cosine similarities.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            model (str): The model to use for generating embeddings (default: EMBED_MODEL).
+
+        Returns:
+            np.ndarray: The unit embeddings as float32, one row per text in the order of the texts.
+        """
+        response = self.embeddings(texts, model=model)
+        vectors = np.array([d.embedding for d in sorted(response.data, key=lambda d: d.index)], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
 
     def pdf_to_embeddings(
         self,
         pdf_path: str,
-        chunk_size: int = 1000,
+        chunk_tokens: int = pdf_chunk_tokens,
+        overlap_tokens: int = pdf_chunk_overlap,
     ) -> List[Embedding]:
         """
         This method is used to generate embeddings for the input.
+        Use common.pdf_ingest.ingest_pdf to process large PDFs batch by batch instead.
 
         Args:
             pdf_path: str: The path to the PDF file.
-            chunk_size: int: The size of the chunks to split the PDF into(default: 1000).
+            chunk_tokens: int: The number of tokens per chunk(default: settings.pdf_chunk_tokens).
+            overlap_tokens: int: The number of tokens shared by consecutive chunks(default: settings.pdf_chunk_overlap).
         Returns:
             List[Embedding]: The embeddings for the input.
         """
-        pdf_reader = PdfReader(pdf_path)
-        chunks = []
-        for page in pdf_reader.pages:
-            text = page.extract_text()
-            chunks.extend([text[i : i + chunk_size] for i in range(0, len(text), chunk_size)])
+        return [
+            embedding
+            for _, batch in ingest_pdf(pdf_path, self, chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+            for embedding in batch
+        ]
 
-        response = self.embeddings(chunks)
-        return [Embedding(id=value.index, vector=value.embedding, text=chunks[value.index]) for value in response.data]
+
+class OpenAIClientRegistry:
+    """
+    This class keeps one long-lived OpenAIClient per API key for the whole process.
+    The OpenAI client is thread-safe, so every session and helper can share it.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str = None) -> OpenAIClient:
+        """
+        This method returns the shared client for the API key, creating it on first use.
+
+        Args:
+            api_key (str): The OpenAI API key (default: the key from the secrets).
+        Returns:
+            OpenAIClient: The shared client.
+        """
+        api_key = api_key or get_secret("openai", "api_key")
+        with self._lock:
+            if api_key not in self._clients:
+                self._clients[api_key] = OpenAIClient(api_key=api_key)
+            return self._clients[api_key]
+
+    def stats(self) -> dict:
+        """
+        This method reports how many clients and HTTP connections are live.
+
+        Returns:
+            dict: The number of clients and of their pooled connections, None if it cannot be read.
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+        connections = [pooled_connections(client) for client in clients]
+        return {"clients": len(clients), "connections": None if None in connections else sum(connections)}
+
+
+def pooled_connections(client: OpenAIClient) -> Optional[int]:
+    """
+    This function returns the number of connections in the pool of a client.
+    httpx does not expose its pool, so it is read from its internals, guarded against their changes.
+
+    Args:
+        client (OpenAIClient): The client.
+
+    Returns:
+        int: The number of pooled connections, or None if the pool cannot be read.
+    """
+    try:
+        return len(client.client._client._transport._pool.connections)  # pylint: disable=protected-access
+    except (AttributeError, TypeError):
+        return None
+
+
+openai_clients = OpenAIClientRegistry()
+
+
+def get_openai_client(api_key: str = None) -> OpenAIClient:
+    """
+    This function returns the process-wide OpenAIClient for the API key.
+
+    Args:
+        api_key (str): The OpenAI API key (default: the key from the secrets).
+    Returns:
+        OpenAIClient: The shared client.
+    """
+    return openai_clients.get(api_key)
+
+
+def get_json(provider: str, url: str, params: dict, headers: dict = None) -> dict:
+    """
+    This function sends a search request, serving it from the search cache when possible.
+    Identical requests in flight at the same time share one upstream call,
+    which waits for the budget of the provider in the shared rate limiter.
+
+    Args:
+        provider (str): The search provider (e.g., 'naver').
+        url (str): The endpoint url.
+        params (dict): The query parameters.
+        headers (dict): The request headers.
+
+    Returns:
+        dict: The raw response. common.search_result parses it into SearchResult records.
+    """
+    cached = search_cache.get(provider, url, params)
+    cache_lookups.inc(cache="search", result="miss" if cached is None else "hit")
+    if cached is not None:
+        return cached
+
+    def fetch():
+        # Inside a fan-out, wait for the budget only until its deadline
+        left = remaining()
+        rate_limiter.acquire(provider, timeout=None if left is None else min(left, rate_limiter.timeout))
+        with timed("search", provider=provider):
+            response = get_transport().get(url, params=params, headers=headers)
+            result = response.json()
+        if response.ok:
+            search_cache.set(provider, url, params, result)
+        else:
+            stage_errors.inc(stage="search", provider=provider)
+        return result
+
+    return search_flights.do(search_cache.key(provider, url, params), fetch)
 
 
 class NaverAPIClient:
@@ -127,15 +347,13 @@ class NaverAPIClient:
     """
 
     def __init__(self):
-        with open(secret_path, "r", encoding="utf-8") as f:
-            __secret = yaml.safe_load(f)
-        __client_id = __secret["naver"]["client_id"]
-        __client_secret = __secret["naver"]["client_secret"]
+        __client_id = get_secret("naver", "client_id")
+        __client_secret = get_secret("naver", "client_secret")
 
-        self.base_url = "https://openapi.naver.com/v1/search"
+        self.base_url = naver_base_url
         self.headers = {"X-Naver-Client-Id": __client_id, "X-Naver-Client-Secret": __client_secret}
 
-    def search(self, query, display=10, start=1, sort="sim"):
+    def search(self, query, display=10, start=1, sort="sim", plan=None):
         """
         This method performs a search using the Naver API based on the provided query.
 
@@ -144,22 +362,22 @@ class NaverAPIClient:
             display (int): The number of results to display (default: 10).
             start (int): The starting point for the results (default: 1).
             sort (str): The sorting method for the results (default: 'sim').
+            plan (SearchPlan): The search plan for the query (default: planned from the query).
 
         Returns:
-            dict: The search results from the Naver API.
+            dict: The raw search response of the Naver API. Its fields keep the <b> markup and the HTML entities,
+                common.search_result.parse_results turns it into clean SearchResult records.
         """
-        __service_type = get_search_service_type(query)
-        __search_query = make_search_query(query, __service_type)
-        url = f"{self.base_url}/{__service_type.lower()}"
+        plan = plan or plan_search(query)
+        url = f"{self.base_url}/{plan.service_type.lower()}"
 
         params = {
-            "query": __search_query,
+            "query": plan.naver_query,
             "start": start,
             "display": display,
             "sort": sort,
         }
-        response = requests.get(url, params=params, headers=self.headers, timeout=10)
-        return json.loads(response.text.replace("<b>", "").replace("</b>", ""))
+        return get_json("naver", url, params, self.headers)
 
     def get_url(self):
         """
@@ -179,14 +397,12 @@ class KakaoAPIClient:
     """
 
     def __init__(self):
-        with open(secret_path, "r", encoding="utf-8") as f:
-            __secret = yaml.safe_load(f)
-        __api_key = __secret["kakao"]["api_key"]
+        __api_key = get_secret("kakao", "api_key")
 
-        self.base_url = "https://dapi.kakao.com/v2/search"
+        self.base_url = f"{kakao_base_url}/v2/search"
         self.headers = {"Authorization": f"KakaoAK {__api_key}"}
 
-    def search(self, query, size=10, page=1, sort="accuracy"):
+    def search(self, query, size=10, page=1, sort="accuracy", plan=None):
         """
         This method performs a search using the Kakao API based on the provided query.
 
@@ -195,12 +411,14 @@ class KakaoAPIClient:
             size (int): The number of results to display (default: 10).
             page (int): The page number for pagination (default: 1).
             sort (str): The sorting method for the results (default: 'accuracy').
+            plan (SearchPlan): The search plan for the query (default: planned from the query).
 
         Returns:
-            dict: The search results from the Kakao API.
+            dict: The raw search response of the Kakao API. Its fields keep the <b> markup and the HTML entities,
+                common.search_result.parse_results turns it into clean SearchResult records.
         """
-        __service_type = get_search_service_type(query)
-        __search_query = make_search_query(query, __service_type)
+        plan = plan or plan_search(query)
+        __service_type = plan.service_type
         if __service_type == "BOOK":
             __service_type = "BOOK"
         elif __service_type == "BLOG":
@@ -211,23 +429,22 @@ class KakaoAPIClient:
             __service_type = "WEB"
 
         if __service_type == "BOOK":
-            url = f"https://dapi.kakao.com/v3/search/{__service_type.lower()}"
+            url = f"{kakao_base_url}/v3/search/{__service_type.lower()}"
         else:
             url = f"{self.base_url}/{__service_type.lower()}"
 
         params = {
-            "query": __search_query,
+            "query": plan.kakao_query,
             "page": page,
             "size": size,
             "sort": sort,
         }
-        response = requests.get(url, params=params, headers=self.headers, timeout=10)
-        return json.loads(response.text.replace("<b>", "").replace("</b>", ""))
+        return get_json("kakao", url, params, self.headers)
 
     def video_search(self, query, size=10, page=1, sort="accuracy"):
         """
-
         This method performs a video search using the Kakao API based on the provided query.
+        The markup and the HTML entities are stripped from the titles and authors of the videos.
 
         Args:
             query (str): The search query for videos.
@@ -245,8 +462,13 @@ class KakaoAPIClient:
             "size": size,
             "sort": sort,
         }
-        response = requests.get(url, params=params, headers=self.headers, timeout=10)
-        return json.loads(response.text.replace("<b>", "").replace("</b>", ""))
+        response = get_json("kakao", url, params, self.headers)
+        # The response may be shared by the search cache, so the documents are copied
+        documents = [
+            {**document, **{name: clean_text(document.get(name)) for name in ("title", "author") if name in document}}
+            for document in response.get("documents") or []
+        ]
+        return {**response, "documents": documents}
 
 
 class GoogleAPIClient:
@@ -261,27 +483,26 @@ class GoogleAPIClient:
     """
 
     def __init__(self):
-        with open(secret_path, "r", encoding="utf-8") as f:
-            __secret = yaml.safe_load(f)
-        self.cx = __secret["google"]["cx"]
-        self.key = __secret["google"]["key"]
+        self.cx = get_secret("google", "cx")
+        self.key = get_secret("google", "key")
 
-        self.base_url = "https://www.googleapis.com/customsearch/v1"
+        self.base_url = google_base_url
 
-    def search(self, query):
+    def search(self, query, plan=None):
         """
         This method performs a search using the Google Custom Search API based on the provided query.
 
         Args:
             query (str): The search query.
+            plan (SearchPlan): The search plan for the query (default: planned from the query).
 
         Returns:
-            dict: The search results from the Google Custom Search API.
+            dict: The raw search response of the Google Custom Search API,
+                common.search_result.parse_results turns it into clean SearchResult records.
         """
-        __search_query = make_search_query(query)
-        params = {"key": self.key, "cx": self.cx, "q": __search_query}
-        response = requests.get(self.base_url, params=params, timeout=10)
-        return json.loads(response.text.replace("<b>", "").replace("</b>", ""))
+        plan = plan or plan_search(query)
+        params = {"key": self.key, "cx": self.cx, "q": plan.google_query}
+        return get_json("google", self.base_url, params)
 
     def get_url(self):
         """
@@ -293,94 +514,182 @@ class GoogleAPIClient:
         return self.base_url
 
 
-def get_search_service_type(query):
+@dataclass(frozen=True)
+class SearchPlan:
     """
-    This method extracts the type of search service based on the provided query.
+    This class is a data class for storing the search plan of a question.
 
-    Args:
-        query: str: The search query to analyze.
+    Attributes:
+        need_search (bool): Whether the question needs an internet search.
+        sorting_type (str): 'LATEST' or 'SIMILARITY'.
+        service_type (str): The type of search service (e.g., 'BLOG', 'NEWS', etc.).
+        naver_query (str): The search query for the Naver API.
+        kakao_query (str): The search query for the Kakao API.
+        google_query (str): The search query for the Google Custom Search API.
+    """
 
-    Returns:
-        str: The type of search service (e.g., 'BLOG', 'NEWS', etc.).
+    need_search: bool
+    sorting_type: str
+    service_type: str
+    naver_query: str
+    kakao_query: str
+    google_query: str
+
+
+class QueryPlanner:
+    """
+    This class plans the search for a question with a single structured output call.
+    It replaces separate calls for the search need, sorting type, service type and search queries.
     """
-    open_ai_client = OpenAIClient()
 
     prompt = """
-        Please extract the type of search service based on the following QUERY. The available options are: 
-        - 'BLOG': Blog posts
-        - 'NEWS': News articles
-        - 'BOOK': Books
-        - 'ENCYC': Encyclopedia entries
-        - 'CAFEARTICLE': Cafe posts
-        - 'WEBKR': Web documents
-        - 'SHOP': Shopping items
-        - 'DOC': Professional documents
-        Make sure to choose the most relevant type that best fits the content of the QUERY provided.
-        **Output Format:** Please respond with only the type (e.g., BOOK) without any additional text or formatting.
+    You are a helpful assistant planning an internet search for the QUERY of a user.
+
+    Please analyze the QUERY and fill in every field:
+    - need_search: true if the QUERY needs an internet search, such as "find," "search," "look up," "what is,"
+      "how to," or specific questions that require external information. Otherwise false.
+    - sorting_type: "LATEST" if the search results should be sorted by the latest (e.g., "latest," "new," "recent"),
+      "SIMILARITY" if they should be sorted by similarity (e.g., "similar," "related").
+    - service_type: The most relevant type of search service for the QUERY. The available options are:
+      {service_types}
+    - naver_query, kakao_query: A search query for the SERVICE_TYPE on Naver and Kakao.
+    - google_query: A search query for Google web search.
+
+    For the search queries, make sure to:
+    1. Use clear and concise language.
+    2. Include relevant keywords that capture the essence of the QUERY.
+    3. Format the query in a way that is likely to yield useful search results.
+    Please don't return special characters like double quotes, and avoid including today's year, month, etc.
     """
-    response = open_ai_client.chat(
-        [
+
+    schema = {
+        "type": "object",
+        "properties": {
+            "need_search": {"type": "boolean"},
+            "sorting_type": {"type": "string", "enum": ["LATEST", "SIMILARITY"]},
+            "service_type": {"type": "string", "enum": list(SEARCH_SERVICE_TYPES)},
+            "naver_query": {"type": "string"},
+            "kakao_query": {"type": "string"},
+            "google_query": {"type": "string"},
+        },
+        "required": ["need_search", "sorting_type", "service_type", "naver_query", "kakao_query", "google_query"],
+        "additionalProperties": False,
+    }
+
+    def __init__(self, client: OpenAIClient = None):
+        self.client = client
+
+    def messages(self, query: str) -> List[dict]:
+        """
+        This method builds the messages to plan the search for the provided query.
+
+        Args:
+            query (str): The question of the user.
+
+        Returns:
+            list[dict]: The messages to send to the OpenAI API.
+        """
+        service_types = "\n      ".join(f"- '{key}': {value}" for key, value in SEARCH_SERVICE_TYPES.items())
+        return [
             {
                 "role": "user",
                 "content": f"""
-            {prompt}
+            {self.prompt.format(service_types=service_types)}
             QUERY: {query}
             """,
             }
         ]
-    )
-    return response
 
+    def plan(self, query: str) -> SearchPlan:
+        """
+        This method plans the search for the provided query.
+
+        Args:
+            query (str): The question of the user.
+
+        Returns:
+            SearchPlan: The search plan for the query.
+        """
+        client = self.client or get_openai_client()
+        response = client.chat_json(self.messages(query), "search_plan", self.schema)
+        return SearchPlan(**response)
 
-def make_search_query(query, service_type=None):
+
+@lru_cache(maxsize=1024)
+def embed_query(query: str) -> np.ndarray:
     """
-    This method creates a search query for a search engine based on the provided query and service type.
+    This function returns the unit embedding of a query, shared by the classifier caches.
 
     Args:
-        query: str: The search query.
-        service_type: str: The type of service to use for the search.
+        query (str): The normalized query.
 
     Returns:
-        str: The formatted search query for the search engine.
-    """
-    open_ai_client = OpenAIClient()
-
-    service_types = {
-        "BLOG": "Blog posts",
-        "NEWS": "News articles",
-        "BOOK": "Books",
-        "ENCYC": "Encyclopedia entries",
-        "CAFEARTICLE": "Cafe posts",
-        "WEBKR": "Web documents",
-        "SHOP": "Shopping items",
-        "DOC": "Professional documents",
-    }
+        np.ndarray: The normalized embedding vector.
+    """
+    vector = get_openai_client().unit_embeddings([query])[0]
+    vector.flags.writeable = False
+    return vector
 
-    prompt = """
-    Please create a search query for a search engine (e.g., Google, Naver) based on the following QUERY and SERVICE_TYPE. 
 
-    Make sure to:
-    1. Use clear and concise language.
-    2. Include relevant keywords that capture the essence of the QUERY.
-    3. Format the query in a way that is likely to yield useful search results.
-    Please don't return special characters like double quotes, and avoid including today's year, month, etc.
-    **Output Format:** Provide the search query as a single string without any additional text or explanation. 
+@lru_cache(maxsize=128)
+def plan_search(query: str) -> SearchPlan:
     """
-    response = open_ai_client.chat(
-        [
-            {
-                "role": "user",
-                "content": f"""
-            {prompt}
-            SERVICE_TYPE: {service_types.get(service_type)}
-            QUERY: {query}
-            """,
-            }
-        ]
-    )
-    return response
+    This function returns the search plan for the provided query.
+    The plan is cached, so the helpers below share one OpenAI call per question,
+    and concurrent callers of the same question wait for the call in flight.
 
+    Args:
+        query (str): The question of the user.
+
+    Returns:
+        SearchPlan: The search plan for the query.
+    """
+    return llm_flights.do(("plan_search", normalize_query(query)), lambda: QueryPlanner().plan(query))
+
+
+@semantic_cached(embed_query)
+def get_search_service_type(query):
+    """
+    This method extracts the type of search service based on the provided query.
+
+    Args:
+        query: str: The search query to analyze.
+
+    Returns:
+        str: The type of search service (e.g., 'BLOG', 'NEWS', etc.).
+    """
+    return plan_search(query).service_type
 
+
+def make_search_query(query, service_type=None, provider=None):
+    """
+    This function returns the search query planned for a provider, a thin wrapper of plan_search.
+
+    The planned queries are tailored to the service type chosen by the planner, so service_type does not
+    change the query: without a provider, it only selects the Naver query, as Naver is the provider
+    of the service types.
+
+    Args:
+        query: str: The search query.
+        service_type: str: The Naver service type of the search, or None.
+        provider: str: 'naver', 'kakao' or 'google'
+            (default: 'naver' with a service type, otherwise 'google').
+
+    Returns:
+        str: The search query for the provider.
+
+    Raises:
+        ValueError: If the provider is unknown.
+    """
+    provider = provider or ("google" if service_type is None else "naver")
+    plan = plan_search(query)
+    queries = {"naver": plan.naver_query, "kakao": plan.kakao_query, "google": plan.google_query}
+    if provider not in queries:
+        raise ValueError(f"provider must be one of {tuple(queries)}, got {provider}")
+    return queries[provider]
+
+
+@semantic_cached(embed_query)
 def is_video_search_need(query):
     """
     This function determines if the provided QUERY indicates a need for video search.
@@ -392,7 +701,7 @@ def is_video_search_need(query):
         str: 'TRUE' if the QUERY suggests that a video search is needed,
               'FALSE' if it does not suggest a need for video search.
     """
-    open_ai_client = OpenAIClient()
+    open_ai_client = get_openai_client()
 
     prompt = """
     You are a helpful assistant.
@@ -421,6 +730,7 @@ def is_video_search_need(query):
     return response
 
 
+@semantic_cached(embed_query)
 def get_sorting_type(query):
     """
     This function determines if the provided QUERY indicates a need for sorting the search results.
@@ -432,35 +742,10 @@ def get_sorting_type(query):
         str: 'LATEST' if the QUERY suggests that the search results should be sorted by the latest,
               'SIMILARITY' if the QUERY suggests that the search results should be sorted by similarity.
     """
-    open_ai_client = OpenAIClient()
-
-    prompt = """
-    You are a helpful assistant.
-
-    When a user provides a QUERY, determine if the QUERY indicates a need for sorting the search results by the latest or by similarity.
-
-    Please analyze the QUERY and respond with:
-    - "LATEST" if the QUERY suggests that the search results should be sorted by the latest.
-    - "SIMILARITY" if the QUERY suggests that the search results should be sorted by similarity.
-
-    Make sure to consider keywords and phrases that typically indicate a request for sorting, such as "latest," "new," "recent," "similar," or "related."
-
-    **Output Format:** Please respond with only "LATEST" or "SIMILARITY" without any additional text or explanation.
-    """
-    response = open_ai_client.chat(
-        [
-            {
-                "role": "user",
-                "content": f"""
-            {prompt}
-            QUERY: {query}
-            """,
-            }
-        ]
-    )
-    return response
+    return plan_search(query).sorting_type
 
 
+@semantic_cached(embed_query)
 def is_need_search(query):
     """
     This function determines if the provided QUERY indicates a need for an internet search.
@@ -472,30 +757,4 @@ def is_need_search(query):
         str: 'TRUE' if the QUERY suggests that an internet search is needed,
               'FALSE' if it does not suggest a need for an internet search.
     """
-    open_ai_client = OpenAIClient()
-
-    prompt = """
-    You are a helpful assistant.
-
-    When a user provides a QUERY, determine if the QUERY indicates a need for an internet search.
-
-    Please analyze the QUERY and respond with:
-    - "TRUE" if the QUERY suggests that an internet search is needed.
-    - "FALSE" if the QUERY does not suggest a need for an internet search.
-
-    Make sure to consider keywords and phrases that typically indicate a request for information retrieval, such as "find," "search," "look up," "what is," "how to," or specific questions that require external information.
-
-    **Output Format:** Please respond with only "TRUE" or "FALSE" without any additional text or explanation.
-    """
-    response = open_ai_client.chat(
-        [
-            {
-                "role": "user",
-                "content": f"""
-            {prompt}
-            QUERY: {query}
-            """,
-            }
-        ]
-    )
-    return response
+    return "TRUE" if plan_search(query).need_search else "FALSE"
@@ -0,0 +1,424 @@
+"""
+This module keeps the conversations of the sessions in an append-only SQLite database.
+
+Only the latest messages of each conversation are kept in memory, older messages are read from
+the database when they are needed. When the in-memory messages of all sessions exceed a cap,
+those of the least recently used sessions are dropped and read again on their next turn.
+The database is in WAL mode, so several Streamlit worker processes can share it.
+The conversations of sessions idle for longer than their retention are deleted, at most once an hour
+per process: anonymous sessions, which are never resumed, are kept for a shorter time.
+"""
+
+import json
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Iterator, List, Tuple
+
+from settings import (
+    conversation_store_path,
+    conversation_hot_messages,
+    conversation_memory_cap,
+    conversation_retention_days,
+    conversation_anonymous_retention_hours,
+)
+from common.sqlite_database import SQLiteDatabase
+
+# The prefix of the sessions whose owner is not authenticated
+ANONYMOUS_PREFIX = "session:"
+
+PURGE_INTERVAL = 60 * 60
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS conversations (
+        session TEXT PRIMARY KEY,
+        number INTEGER NOT NULL,
+        started REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        session TEXT NOT NULL,
+        number INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        created REAL NOT NULL,
+        PRIMARY KEY (session, number, seq)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS summaries (
+        session TEXT NOT NULL,
+        number INTEGER NOT NULL,
+        summary TEXT,
+        summarized INTEGER NOT NULL,
+        PRIMARY KEY (session, number)
+    )
+    """,
+]
+
+
+def message_size(message: dict) -> int:
+    """
+    This function estimates the memory taken by a message.
+
+    Args:
+        message (dict): The message.
+
+    Returns:
+        int: The size of the dict and its values in bytes.
+    """
+    return sys.getsizeof(message) + sum(sys.getsizeof(value) for value in message.values())
+
+
+class StoredHistory(Sequence):
+    """
+    This class is the chat history of a session, a list-like view of its current conversation.
+    Messages can only be appended; clear starts a new conversation and keeps the previous one stored.
+
+    Attributes:
+        store (ConversationStore): The store of the history.
+        session (str): The id of the session.
+    """
+
+    def __init__(self, store: "ConversationStore", session: str):
+        self.store = store
+        self.session = session
+        self._number = 0  # the number of the current conversation of the session
+        self._length = 0
+        self._offset = 0  # the index of the first message of the tail
+        self._tail = None  # the latest messages, or None when they are not in memory
+        self.size = 0  # the estimated bytes of the tail
+
+    @property
+    def conversation(self) -> Tuple[str, int]:
+        """
+        The session and the number of the current conversation.
+        """
+        with self.store.lock:
+            self._load()
+            return self.session, self._number
+
+    def _load(self):
+        if self._tail is None:
+            self._number, self._length = self.store.current(self.session)
+            self._offset = max(0, self._length - self.store.hot_messages)
+            self._tail = self.store.read(self.session, self._number, self._offset, self._length)
+            self.store.admit(self)
+            self._resize(sum(message_size(message) for message in self._tail))
+            self.store.evict()
+        else:
+            self.store.touch(self)
+
+    def _resize(self, size: int):
+        self.store.account(size - self.size)
+        self.size = size
+
+    def unload(self):
+        """
+        This method drops the messages kept in memory, which are read again on the next access.
+        """
+        self._tail = None
+        self._resize(0)
+
+    def _trim(self):
+        size = self.size
+        while len(self._tail) > self.store.hot_messages:
+            size -= message_size(self._tail.pop(0))
+            self._offset += 1
+        self._resize(size)
+
+    def __len__(self) -> int:
+        with self.store.lock:
+            self._load()
+            return self._length
+
+    def _range(self, start: int, stop: int) -> List[dict]:
+        older = []
+        if start < self._offset:
+            older = self.store.read(self.session, self._number, start, min(stop, self._offset))
+        return older + self._tail[max(start, self._offset) - self._offset : max(stop, self._offset) - self._offset]
+
+    def __getitem__(self, index):
+        with self.store.lock:
+            self._load()
+            if isinstance(index, slice):
+                start, stop, step = index.indices(self._length)
+                if step != 1:
+                    return self._range(0, self._length)[index]
+                return self._range(start, max(start, stop))
+            if index < 0:
+                index += self._length
+            if not 0 <= index < self._length:
+                raise IndexError("history index out of range")
+            return self._range(index, index + 1)[0]
+
+    def __iter__(self) -> Iterator[dict]:
+        # Read the older messages a batch at a time, so they are never all in memory
+        length = len(self)
+        batch = max(1, self.store.hot_messages)
+        for start in range(0, length, batch):
+            yield from self[start : min(start + batch, length)]
+
+    def append(self, message: dict):
+        """
+        This method adds a message at the end of the conversation.
+
+        Args:
+            message (dict): The message, with its role and content.
+        """
+        self.extend([message])
+
+    def extend(self, messages: List[dict]):
+        """
+        This method adds messages at the end of the conversation.
+
+        Args:
+            messages (list[dict]): The messages, with their role and content.
+        """
+        messages = list(messages)
+        with self.store.lock:
+            self._load()
+            self.store.write(self.session, self._number, self._length, messages)
+            self._tail.extend(messages)
+            self._length += len(messages)
+            self._resize(self.size + sum(message_size(message) for message in messages))
+            self._trim()
+            self.store.evict()
+
+    def clear(self):
+        """
+        This method starts a new conversation. The previous one stays in the database.
+        """
+        with self.store.lock:
+            self._load()
+            self._number = self.store.start(self.session)
+            self._length = self._offset = 0
+            self._tail = []
+            self._resize(0)
+
+    def load_summary(self) -> Tuple[str, int]:
+        """
+        This method returns the saved summary of the current conversation, see HistoryWindow.
+
+        Returns:
+            tuple[str, int]: The summary, or None, and the number of turns it folds.
+        """
+        with self.store.lock:
+            self._load()
+            return self.store.summary(self.session, self._number)
+
+    def save_summary(self, summary: str, summarized: int):
+        """
+        This method saves the summary of the current conversation, see HistoryWindow.
+
+        Args:
+            summary (str): The summary of the older turns.
+            summarized (int): The number of turns, after the leading system messages, folded into the summary.
+        """
+        with self.store.lock:
+            self._load()
+            self.store.save_summary(self.session, self._number, summary, summarized)
+
+    def __repr__(self):
+        return f"StoredHistory(session={self.session!r}, messages={len(self)})"
+
+
+class ConversationStore:
+    """
+    This class keeps the conversations in a SQLite database and the latest messages of the
+    recently active sessions in memory, within a global cap.
+
+    Attributes:
+        database (SQLiteDatabase): The SQLite database of the conversations.
+        hot_messages (int): The number of latest messages of a session kept in memory.
+        memory_cap (int): The maximum bytes of the messages kept in memory for all sessions.
+        retention (float): The seconds a conversation is kept after the last activity of its session.
+        anonymous_retention (float): The retention of the sessions starting with ANONYMOUS_PREFIX.
+        lock (threading.RLock): The lock of the in-memory messages.
+    """
+
+    def __init__(
+        self,
+        path: str = conversation_store_path,
+        hot_messages: int = conversation_hot_messages,
+        memory_cap: int = conversation_memory_cap,
+        retention: float = conversation_retention_days * 24 * 60 * 60,
+        anonymous_retention: float = conversation_anonymous_retention_hours * 60 * 60,
+    ):
+        self.database = SQLiteDatabase(path, SCHEMA)
+        self.hot_messages = hot_messages
+        self.memory_cap = memory_cap
+        self.retention = retention
+        self.anonymous_retention = anonymous_retention
+        self.lock = threading.RLock()
+        self._purged = 0.0  # the monotonic time of the last purge of this process
+        self._histories = weakref.WeakValueDictionary()  # session -> StoredHistory
+        self._hot = OrderedDict()  # session -> StoredHistory with messages in memory, least recent first
+        self._memory = 0  # the estimated bytes of the messages in memory
+
+    def history(self, session: str) -> StoredHistory:
+        """
+        This method returns the history of a session, resuming its current conversation if it is stored.
+
+        Args:
+            session (str): The id of the session.
+
+        Returns:
+            StoredHistory: The history of the session.
+        """
+        with self.lock:
+            history = self._histories.get(session)
+            if history is None:
+                history = self._histories[session] = StoredHistory(self, session)
+            return history
+
+    def current(self, session: str) -> Tuple[int, int]:
+        """
+        This method returns the number and the length of the current conversation of a session.
+        """
+        connection = self.database.connection()
+        row = connection.execute("SELECT number FROM conversations WHERE session = ?", (session,)).fetchone()
+        number = row[0] if row else 0
+        (length,) = connection.execute(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session = ? AND number = ?", (session, number)
+        ).fetchone()
+        return number, length
+
+    def start(self, session: str) -> int:
+        """
+        This method starts a new conversation of a session and returns its number.
+        """
+        connection = self.database.connection()
+        connection.execute(
+            """
+            INSERT INTO conversations VALUES (?, 1, ?)
+            ON CONFLICT (session) DO UPDATE SET number = number + 1, started = excluded.started
+            """,
+            (session, time.time()),
+        )
+        return connection.execute("SELECT number FROM conversations WHERE session = ?", (session,)).fetchone()[0]
+
+    def read(self, session: str, number: int, start: int, stop: int) -> List[dict]:
+        """
+        This method reads the messages of a conversation from start to stop, excluded.
+        """
+        if start >= stop:
+            return []
+        rows = self.database.connection().execute(
+            "SELECT message FROM messages WHERE session = ? AND number = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (session, number, start, stop),
+        )
+        return [json.loads(message) for (message,) in rows]
+
+    def write(self, session: str, number: int, start: int, messages: List[dict]):
+        """
+        This method appends the messages to a conversation, the first one at index start.
+        """
+        now = time.time()
+        with self.database.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                [
+                    (session, number, start + i, json.dumps(message, ensure_ascii=False), now)
+                    for i, message in enumerate(messages)
+                ],
+            )
+        if time.monotonic() - self._purged >= PURGE_INTERVAL:
+            self.purge()
+
+    def retention_of(self, session: str) -> float:
+        """
+        This method returns the seconds the conversations of a session are kept after its last activity.
+        """
+        return self.anonymous_retention if session.startswith(ANONYMOUS_PREFIX) else self.retention
+
+    def purge(self, now: float = None) -> int:
+        """
+        This method deletes the conversations of the sessions idle for longer than their retention.
+        The sessions with a history in this process are kept.
+
+        Args:
+            now (float): The current time (default: time.time()).
+
+        Returns:
+            int: The number of sessions deleted.
+        """
+        now = time.time() if now is None else now
+        self._purged = time.monotonic()
+        with self.database.transaction() as connection:
+            rows = connection.execute(
+                """
+                SELECT session, MAX(active) FROM (
+                    SELECT session, created AS active FROM messages
+                    UNION ALL SELECT session, started AS active FROM conversations
+                ) GROUP BY session
+                """
+            ).fetchall()
+            idle = [
+                (session,)
+                for session, active in rows
+                if session not in self._histories
+                and active < now - self.retention_of(session)
+            ]
+            for table in ("messages", "summaries", "conversations"):
+                connection.executemany(f"DELETE FROM {table} WHERE session = ?", idle)
+        return len(idle)
+
+    def summary(self, session: str, number: int) -> Tuple[str, int]:
+        """
+        This method returns the summary of a conversation and the number of turns it folds.
+        """
+        row = self.database.connection().execute(
+            "SELECT summary, summarized FROM summaries WHERE session = ? AND number = ?", (session, number)
+        ).fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def save_summary(self, session: str, number: int, summary: str, summarized: int):
+        """
+        This method replaces the summary of a conversation. Unlike the messages, summaries are rewritten.
+        """
+        self.database.connection().execute(
+            "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)", (session, number, summary, summarized)
+        )
+
+    def admit(self, history: StoredHistory):
+        """
+        This method registers a history whose messages were just read into memory.
+        """
+        self._hot[history.session] = history
+
+    def touch(self, history: StoredHistory):
+        """
+        This method marks a history as the most recently used.
+        """
+        self._hot.move_to_end(history.session)
+
+    def account(self, delta: int):
+        """
+        This method adds the change of the bytes of a history kept in memory.
+        """
+        self._memory += delta
+
+    def evict(self):
+        """
+        This method drops the in-memory messages of the least recently used sessions while over the cap.
+        The most recently used session is always kept.
+        """
+        while len(self._hot) > 1 and self._memory > self.memory_cap:
+            _, history = self._hot.popitem(last=False)
+            history.unload()
+
+    def stats(self) -> dict:
+        """
+        This method returns the number of sessions with messages in memory and their estimated bytes.
+        """
+        with self.lock:
+            return {"hot_sessions": len(self._hot), "memory": self._memory, "memory_cap": self.memory_cap}
+
+
+conversations = ConversationStore()
@@ -0,0 +1,205 @@
+"""
+This file defines the data classes for embeddings.
+
+Vectors are stored in compact NumPy buffers: float32 by default, or quantized to float16/int8.
+Many embeddings are kept as one contiguous matrix in an EmbeddingBatch, which has a binary
+file format that loads without copying through a memory map.
+"""
+
+import json
+import struct
+from typing import Iterable, Iterator, List, Union
+
+import numpy as np
+
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+BATCH_MAGIC = b"EMBBATCH"
+BATCH_ALIGNMENT = 64
+
+
+class Embedding:
+    """
+    This class is a slotted container for storing one embedding.
+
+    Attributes:
+        id (str): The id of the embedding.
+        text (str): The embedded text.
+        dtype (str): The storage type of the vector: 'float32', 'float16' or 'int8'.
+    """
+
+    __slots__ = ("id", "text", "_data", "_scale")
+
+    def __init__(self, id, vector, text: str, dtype: str = "float32"):  # pylint: disable=redefined-builtin
+        if dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"dtype must be one of {EMBEDDING_DTYPES}, got {dtype}")
+        self.id = id
+        self.text = text
+        vector = np.asarray(vector, dtype=np.float32)
+        self._scale = 1.0
+        if dtype == "int8":
+            self._scale = float(np.abs(vector).max()) / 127 or 1.0
+            self._data = np.round(vector / self._scale).astype(np.int8)
+        else:
+            self._data = vector.astype(dtype, copy=False)
+
+    @property
+    def dtype(self) -> str:
+        """
+        The storage type of the vector.
+        """
+        return self._data.dtype.name
+
+    @property
+    def vector(self) -> np.ndarray:
+        """
+        The vector as float32. Float32 embeddings return their buffer without copying.
+        """
+        if self._data.dtype == np.int8:
+            return self._data.astype(np.float32) * np.float32(self._scale)
+        return self._data.astype(np.float32, copy=False)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The size of the vector buffer in bytes.
+        """
+        return self._data.nbytes
+
+    def quantize(self, dtype: str) -> "Embedding":
+        """
+        This method returns a copy of the embedding stored as another type.
+
+        Args:
+            dtype (str): 'float32', 'float16' or 'int8'.
+        Returns:
+            Embedding: The quantized embedding.
+        """
+        return Embedding(id=self.id, vector=self.vector, text=self.text, dtype=dtype)
+
+    def to_dict(self):
+        """
+        This method is used to convert the embedding to a dictionary.
+
+        Args:
+            None
+        Returns:
+            dict: The embedding as a dictionary.
+        """
+        return {"id": self.id, "vector": self.vector.tolist(), "text": self.text}
+
+    def __eq__(self, other):
+        if not isinstance(other, Embedding):
+            return NotImplemented
+        return self.id == other.id and self.text == other.text and np.array_equal(self.vector, other.vector)
+
+    def __repr__(self):
+        return f"Embedding(id={self.id!r}, dim={len(self._data)}, dtype={self.dtype}, text={self.text[:30]!r})"
+
+
+class EmbeddingBatch:
+    """
+    This class stores many embeddings as one contiguous float32 matrix.
+
+    Attributes:
+        ids (list): The id of each row.
+        matrix (np.ndarray): The (rows, dim) float32 matrix of the vectors.
+        texts (list[str]): The text of each row.
+    """
+
+    __slots__ = ("ids", "matrix", "texts")
+
+    def __init__(self, ids: List, matrix: np.ndarray, texts: List[str]):
+        if len(ids) != len(matrix) or len(texts) != len(matrix):
+            raise ValueError("ids, matrix and texts must have the same number of rows")
+        self.ids = list(ids)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.texts = list(texts)
+
+    @classmethod
+    def from_embeddings(cls, embeddings: Iterable[Embedding]) -> "EmbeddingBatch":
+        """
+        This method packs embeddings into a batch.
+
+        Args:
+            embeddings (Iterable[Embedding]): The embeddings.
+        Returns:
+            EmbeddingBatch: The batch.
+        """
+        embeddings = list(embeddings)
+        if not embeddings:
+            return cls([], np.zeros((0, 0), dtype=np.float32), [])
+        return cls(
+            [embedding.id for embedding in embeddings],
+            np.stack([embedding.vector for embedding in embeddings]),
+            [embedding.text for embedding in embeddings],
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> Embedding:
+        return Embedding(id=self.ids[index], vector=self.matrix[index], text=self.texts[index])
+
+    def __iter__(self) -> Iterator[Embedding]:
+        return (self[i] for i in range(len(self)))
+
+    def save(self, path: str):
+        """
+        This method writes the batch to a binary file: a magic number, the length of a JSON header
+        with the shape, ids and texts, padding, and the raw float32 matrix aligned to 64 bytes.
+
+        Args:
+            path (str): The path to the file.
+        """
+        header = json.dumps(
+            {"dtype": "float32", "shape": list(self.matrix.shape), "ids": self.ids, "texts": self.texts},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        prefix = len(BATCH_MAGIC) + 8 + len(header)
+        padding = -prefix % BATCH_ALIGNMENT
+        with open(path, "wb") as f:
+            f.write(BATCH_MAGIC)
+            f.write(struct.pack("<Q", len(header) + padding))
+            f.write(header + b" " * padding)
+            self.matrix.tofile(f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "EmbeddingBatch":
+        """
+        This method reads a batch written by save().
+
+        Args:
+            path (str): The path to the file.
+            mmap (bool): Whether to memory-map the matrix instead of reading it (default: True).
+        Returns:
+            EmbeddingBatch: The batch. A memory-mapped matrix is read-only.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(BATCH_MAGIC)) != BATCH_MAGIC:
+                raise ValueError(f"{path} is not an embedding batch file")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+            offset = f.tell()
+            shape = tuple(header["shape"])
+            if mmap and shape[0]:
+                matrix = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=shape)
+            else:
+                matrix = np.fromfile(f, dtype=np.float32, count=shape[0] * shape[1]).reshape(shape)
+        batch = cls.__new__(cls)
+        batch.ids, batch.matrix, batch.texts = header["ids"], matrix, header["texts"]
+        return batch
+
+
+def as_matrix(embeddings: Union[EmbeddingBatch, Iterable[Embedding]]) -> np.ndarray:
+    """
+    This function returns the vectors of embeddings as one float32 matrix, without copying a batch.
+
+    Args:
+        embeddings (EmbeddingBatch | Iterable[Embedding]): The embeddings.
+    Returns:
+        np.ndarray: The (rows, dim) float32 matrix.
+    """
+    if isinstance(embeddings, EmbeddingBatch):
+        return embeddings.matrix
+    return np.stack([embedding.vector for embedding in embeddings])
@@ -0,0 +1,132 @@
+"""
+This module runs independent tasks, such as provider searches, concurrently under one deadline.
+
+Each task name (e.g. 'naver' or 'plan') has its own pool of workers, so a provider that hangs
+only holds its own workers. A task reads the time left before its deadline with remaining(),
+and the HTTP transport stops sending and retrying the request at that time.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Any, Optional
+
+from settings import search_deadline, search_workers
+
+logger = logging.getLogger(__name__)
+
+_executors = {}  # task name -> ThreadPoolExecutor
+_executors_lock = threading.Lock()
+_local = threading.local()
+
+
+def _executor(name: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix=f"fan-out-{name}")
+        return _executors[name]
+
+
+def _run(task: Callable[[], Any], deadline: float) -> Any:
+    _local.deadline = deadline
+    try:
+        return task()
+    finally:
+        _local.deadline = None
+
+
+def remaining() -> Optional[float]:
+    """
+    This function returns the seconds left before the deadline of the fan-out running the current task.
+
+    Returns:
+        float: The seconds left, at least 0, or None outside a fan-out task.
+    """
+    deadline = getattr(_local, "deadline", None)
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+@dataclass
+class FanOutResult:
+    """
+    This class is a data class for storing the results of a fan-out.
+
+    Attributes:
+        results (dict): The results of the tasks that finished in time, by task name.
+        timed_out (list): The names of the tasks that did not finish before the deadline.
+        errors (dict): The exceptions of the tasks that failed, by task name.
+        elapsed (float): The seconds spent waiting for the tasks.
+    """
+
+    results: Dict[str, Any] = field(default_factory=dict)
+    timed_out: List[str] = field(default_factory=list)
+    errors: Dict[str, BaseException] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+
+class FanOut:
+    """
+    This class runs tasks in the background from its creation, so other work can overlap with them.
+
+    Attributes:
+        tasks (dict): The callables to run, by task name.
+        started (float): The monotonic time the tasks were submitted.
+        deadline (float): The overall seconds given to the tasks, counted from their submission.
+    """
+
+    def __init__(self, tasks: Dict[str, Callable[[], Any]], deadline: float = None):
+        self.tasks = tasks
+        self.started = time.monotonic()
+        self.deadline = search_deadline if deadline is None else deadline
+        self._futures = {
+            _executor(name).submit(_run, task, self.started + self.deadline): name for name, task in tasks.items()
+        }
+
+    def wait(self) -> FanOutResult:
+        """
+        This method waits for the tasks and returns whatever finished before the deadline.
+
+        Returns:
+            FanOutResult: The results, the timed out task names and the errors.
+        """
+        done, not_done = wait(self._futures, timeout=max(0.0, self.started + self.deadline - time.monotonic()))
+
+        result = FanOutResult(elapsed=time.monotonic() - self.started)
+        for future in done:
+            name = self._futures[future]
+            try:
+                result.results[name] = future.result()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning("fan-out task %s failed: %s", name, e)
+                result.errors[name] = e
+        for future in not_done:
+            future.cancel()
+            result.timed_out.append(self._futures[future])
+        if result.timed_out:
+            logger.warning("fan-out tasks timed out after %.1fs: %s", self.deadline, ", ".join(result.timed_out))
+        return result
+
+    def cancel(self) -> List[str]:
+        """
+        This method cancels the tasks that have not started. The running tasks finish in the background.
+
+        Returns:
+            list: The names of the tasks that had already started.
+        """
+        return [name for future, name in self._futures.items() if not future.cancel()]
+
+
+def fan_out(tasks: Dict[str, Callable[[], Any]], deadline: float = None) -> FanOutResult:
+    """
+    This function runs the tasks at once and returns whatever finished before the deadline.
+
+    Args:
+        tasks (dict): The callables to run, by task name.
+        deadline (float): The overall seconds to wait for the tasks (default: settings.search_deadline).
+
+    Returns:
+        FanOutResult: The results, the timed out task names and the errors.
+    """
+    return FanOut(tasks, deadline).wait()
@@ -0,0 +1,142 @@
+"""
+This module keeps the conversation sent to the model within a token budget.
+
+The most recent turns are sent as they are and older turns are folded into a running summary.
+"""
+
+from typing import List
+
+from settings import history_token_budget, history_summary_batch_tokens, history_summary_max_batches
+from common.client import OpenAIClient, get_openai_client
+from common.tokens import count_tokens, count_message_tokens
+
+SUMMARY_PROMPT = """
+    You are a helpful assistant.
+    Update the SUMMARY of a conversation with the NEW MESSAGES.
+    Keep the facts, names, numbers, decisions and open requests of the user that later turns may need.
+    **Output Format:** Respond with only the updated summary, in the language of the conversation.
+"""
+
+
+class HistoryWindow:
+    """
+    This class fits a chat history into a token budget with a rolling summary of the older turns.
+    Keep one window per conversation so the summary is updated incrementally. The summary of a stored
+    history is saved with its conversation, so any window resumes it.
+
+    Attributes:
+        budget (int): The maximum number of tokens of the recent turns sent as they are.
+        batch_tokens (int): The maximum number of tokens of the turns folded by one summary call.
+        max_batches (int): The maximum number of summary calls per fit. Older overflowing turns are dropped.
+        summary (str): The summary of the turns that no longer fit.
+        summarized (int): The number of turns, after the leading system messages, folded into the summary.
+    """
+
+    def __init__(
+        self,
+        budget: int = history_token_budget,
+        client: OpenAIClient = None,
+        batch_tokens: int = history_summary_batch_tokens,
+        max_batches: int = history_summary_max_batches,
+    ):
+        self.budget = budget
+        self.client = client
+        self.batch_tokens = batch_tokens
+        self.max_batches = max_batches
+        self.summary = None
+        self.summarized = 0
+        self._conversation = None  # the stored conversation whose summary was restored
+
+    def reset(self):
+        """
+        This method forgets the summary, e.g. when the conversation is reset.
+        """
+        self.summary = None
+        self.summarized = 0
+
+    def _tail_start(self, history: List[dict], pinned: int, limit: int) -> int:
+        count = len(history) - pinned
+        tokens = 0
+        start = count
+        for i in range(count - 1, self.summarized - 1, -1):
+            tokens += count_message_tokens([history[pinned + i]])
+            if tokens > limit:
+                break
+            start = i
+        # The latest turn is always sent as it is
+        return max(min(start, count - 1), self.summarized)
+
+    def _batches(self, history: List[dict], pinned: int, start: int) -> List[List[dict]]:
+        # The newest overflowing turns, in batches of at most batch_tokens, oldest batch first
+        batches = [[]]
+        tokens = 0
+        for i in range(start - 1, self.summarized - 1, -1):
+            turn = history[pinned + i]
+            turn_tokens = count_message_tokens([turn])
+            if batches[-1] and tokens + turn_tokens > self.batch_tokens:
+                if len(batches) == self.max_batches:
+                    break
+                batches.append([])
+                tokens = 0
+            batches[-1].append(turn)
+            tokens += turn_tokens
+        return [batch[::-1] for batch in reversed(batches)]
+
+    def _summarize(self, turns: List[dict]):
+        conversation = "\n".join(f"{turn['role'].upper()}: {turn['content']}" for turn in turns)
+        tokens = count_tokens(conversation)
+        if tokens > self.batch_tokens:
+            # A single turn over the batch size is cut
+            conversation = conversation[: len(conversation) * self.batch_tokens // tokens]
+        self.summary = (self.client or get_openai_client()).chat(
+            [
+                {
+                    "role": "user",
+                    "content": f"""
+            {SUMMARY_PROMPT}
+            SUMMARY: {self.summary or ""}
+            NEW MESSAGES:
+            {conversation}
+            """,
+                }
+            ]
+        )
+
+    def fit(self, history: List[dict]) -> List[dict]:
+        """
+        This method returns the messages to send for the history.
+        When the recent turns exceed the budget, the oldest ones are summarized
+        until the rest fits in half of the budget, so summaries are not updated every turn.
+        Only the turns from the summarized ones on are read, so a stored history is not loaded whole.
+        The overflowing turns are folded in batches of at most batch_tokens, with at most max_batches calls,
+        so a long history given to a new window costs a bounded number of bounded calls.
+
+        Args:
+            history (list[dict]): The whole chat history.
+
+        Returns:
+            list[dict]: The leading system messages, the summary and the recent turns.
+        """
+        conversation = getattr(history, "conversation", None)
+        if conversation is not None and conversation != self._conversation:
+            self.summary, self.summarized = history.load_summary()
+            self._conversation = conversation
+
+        pinned = 0
+        while pinned < len(history) and history[pinned]["role"] == "system":
+            pinned += 1
+        if self.summarized > len(history) - pinned:
+            self.reset()
+
+        if self._tail_start(history, pinned, self.budget) > self.summarized:
+            start = self._tail_start(history, pinned, self.budget // 2)
+            for batch in self._batches(history, pinned, start):
+                self._summarize(batch)
+            self.summarized = start
+            if conversation is not None:
+                history.save_summary(self.summary, self.summarized)
+
+        summary = []
+        if self.summary:
+            summary = [{"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}]
+        return list(history[:pinned]) + summary + list(history[pinned + self.summarized :])
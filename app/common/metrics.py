@@ -0,0 +1,225 @@
+"""
+This module provides the latency, token, error and cache metrics of the app.
+
+The metrics are kept in memory for the current process and rendered in the Prometheus text format.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+# Upper bounds in seconds, from a cache hit to a long completion
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format(labels: Tuple[Tuple[str, str], ...], **extra) -> str:
+    pairs = list(labels) + [(name, str(value)) for name, value in extra.items()]
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """
+    This class is a monotonically increasing count by labels.
+
+    Attributes:
+        name (str): The name of the metric.
+        help (str): The description of the metric.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        This method increases the count of the labels.
+
+        Args:
+            amount (float): The amount to add (default: 1).
+            **labels: The labels of the count.
+        """
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[Tuple[Tuple[str, str], ...], float]:
+        """
+        This method returns the counts by labels.
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> Iterator[str]:
+        """
+        This method yields the samples of the metric in the Prometheus text format.
+        """
+        for labels, value in sorted(self.values().items()):
+            yield f"{self.name}{_format(labels)} {value}"
+
+
+class Histogram:
+    """
+    This class is a distribution of observations by labels, counted in cumulative buckets.
+
+    Attributes:
+        name (str): The name of the metric.
+        help (str): The description of the metric.
+        buckets (tuple): The upper bounds of the buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """
+        This method records an observation.
+
+        Args:
+            value (float): The observed value.
+            **labels: The labels of the observation.
+        """
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            counts[index] += 1
+            counts[-1] += value
+
+    def summary(self) -> Dict[Tuple[Tuple[str, str], ...], dict]:
+        """
+        This method returns the count, sum and mean of the observations by labels.
+        """
+        with self._lock:
+            values = {labels: list(counts) for labels, counts in self._values.items()}
+        summary = {}
+        for labels, counts in values.items():
+            count = sum(counts[:-1])
+            summary[labels] = {"count": count, "sum": counts[-1], "mean": counts[-1] / count if count else 0.0}
+        return summary
+
+    def render(self) -> Iterator[str]:
+        """
+        This method yields the samples of the metric in the Prometheus text format.
+        """
+        with self._lock:
+            values = {labels: list(counts) for labels, counts in self._values.items()}
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format(labels, le=le)} {cumulative}"
+            yield f"{self.name}_sum{_format(labels)} {counts[-1]}"
+            yield f"{self.name}_count{_format(labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    This class keeps the metrics of the process and renders them in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        This method adds a metric, returning the one already registered under the same name.
+
+        Args:
+            metric (Counter | Histogram): The metric.
+
+        Returns:
+            Counter | Histogram: The registered metric.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """
+        This method renders every metric in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_duration = registry.register(
+    Histogram("chatbot_stage_duration_seconds", "Duration of the upstream calls and processing stages.")
+)
+stage_errors = registry.register(Counter("chatbot_stage_errors_total", "Failed upstream calls and stages."))
+openai_tokens = registry.register(Counter("chatbot_openai_tokens_total", "Tokens used by the OpenAI API."))
+cache_lookups = registry.register(Counter("chatbot_cache_lookups_total", "Cache lookups by cache and result."))
+chat_actions = registry.register(Counter("chatbot_chat_actions_total", "Actions performed by the chat bot."))
+speculations = registry.register(
+    Counter(
+        "chatbot_search_speculations_total", "Speculative searches by outcome: hit, no_search, resorted or mismatch."
+    )
+)
+speculation_wasted = registry.register(
+    Counter("chatbot_search_speculation_wasted_requests_total", "Speculative provider searches started then discarded.")
+)
+
+
+@contextmanager
+def timed(stage: str, **labels):
+    """
+    This function times a block as a stage, counting an error if the block raises.
+
+    Args:
+        stage (str): The name of the stage (e.g., 'openai.chat').
+        **labels: More labels of the stage (e.g., provider='naver').
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=stage, **labels)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+def record_usage(model: str, usage):
+    """
+    This function counts the tokens of the usage field of an OpenAI response.
+
+    Args:
+        model (str): The model of the request.
+        usage: The usage of the response, or None.
+    """
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            openai_tokens.inc(tokens, model=model, type=kind[: -len("_tokens")])
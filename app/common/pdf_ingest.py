@@ -0,0 +1,278 @@
+"""
+This module ingests PDFs as a stream: pages are read lazily, split into overlapping token chunks
+and embedded in size-bounded batches with bounded concurrency, so memory use does not grow with the PDF.
+"""
+
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from settings import (
+    pdf_chunk_tokens,
+    pdf_chunk_overlap,
+    embedding_batch_tokens,
+    embedding_batch_size,
+    embedding_concurrency,
+    pdf_extract_workers,
+    pdf_parallel_min_pages,
+    pdf_pages_per_task,
+)
+from common.embedding import EmbeddingBatch
+from common.metrics import stage_duration, stage_errors, timed
+from common.tokens import tokenize, detokenize, character_boundary
+
+
+@dataclass
+class IngestProgress:
+    """
+    This class is a data class for storing the progress of an ingestion.
+
+    Attributes:
+        total_pages (int): The number of pages of the PDF.
+        pages (int): The number of pages read.
+        chunks (int): The number of chunks embedded.
+        batches (int): The number of batches embedded.
+    """
+
+    total_pages: int = 0
+    pages: int = 0
+    chunks: int = 0
+    batches: int = 0
+
+
+def open_pdf(pdf_path: str):
+    """
+    This function opens a PDF, importing PyPDF2 only when a PDF is actually read.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+
+    Returns:
+        PyPDF2.PdfReader: The reader of the PDF.
+    """
+    from PyPDF2 import PdfReader  # pylint: disable=import-outside-toplevel
+
+    return PdfReader(pdf_path)
+
+
+# Each worker process parses the PDF once and reuses it for all its page ranges
+_open_pdf_cached = lru_cache(maxsize=4)(open_pdf)
+
+
+def extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """
+    This function extracts the text of a range of pages with its own reader, so it can run in a worker process.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        start (int): The first page index.
+        stop (int): The page index after the last one.
+
+    Returns:
+        list[str]: The text of each page.
+    """
+    pdf_reader = _open_pdf_cached(pdf_path)
+    return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pages_parallel(
+    pdf_path: str,
+    workers: int = pdf_extract_workers,
+    pages_per_task: int = pdf_pages_per_task,
+    progress: IngestProgress = None,
+    total_pages: int = None,
+) -> Iterator[str]:
+    """
+    This function extracts the text of the pages in a process pool, yielding them in page order.
+    At most two page ranges per worker are extracted ahead of the consumer.
+    The workers are spawned, not forked, since the Streamlit and API processes run threads.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        workers (int): The number of worker processes.
+        pages_per_task (int): The number of pages extracted by one task.
+        progress (IngestProgress): The progress to update with the pages read.
+        total_pages (int): The number of pages of the PDF, if already known.
+
+    Returns:
+        Iterator[str]: The text of each page.
+    """
+    if total_pages is None:
+        total_pages = len(open_pdf(pdf_path).pages)
+    if progress is not None:
+        progress.total_pages = total_pages
+    ranges = iter((start, min(start + pages_per_task, total_pages)) for start in range(0, total_pages, pages_per_task))
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        for start, stop in ranges:
+            pending.append(executor.submit(extract_page_range, pdf_path, start, stop))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            start = time.perf_counter()
+            try:
+                texts = pending.popleft().result()
+            except Exception:
+                stage_errors.inc(stage="pdf.extract")
+                raise
+            # Only the time the consumer waits for the pool, the rest overlaps with it
+            stage_duration.observe(time.perf_counter() - start, stage="pdf.extract", mode="parallel")
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(executor.submit(extract_page_range, pdf_path, *next_range))
+            for text in texts:
+                if progress is not None:
+                    progress.pages += 1
+                yield text
+
+
+def iter_pages(pdf_path: str, progress: IngestProgress = None, workers: int = pdf_extract_workers) -> Iterator[str]:
+    """
+    This function extracts the text of the pages one at a time.
+    PDFs of at least settings.pdf_parallel_min_pages pages are extracted by a process pool when workers > 1.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        progress (IngestProgress): The progress to update with the pages read.
+        workers (int): The number of worker processes.
+
+    Returns:
+        Iterator[str]: The text of each page.
+    """
+    pdf_reader = open_pdf(pdf_path)
+    total_pages = len(pdf_reader.pages)
+    if workers > 1 and total_pages >= pdf_parallel_min_pages:
+        yield from iter_pages_parallel(pdf_path, workers=workers, progress=progress, total_pages=total_pages)
+        return
+
+    if progress is not None:
+        progress.total_pages = total_pages
+    for page in pdf_reader.pages:
+        with timed("pdf.extract", mode="serial"):
+            text = page.extract_text() or ""
+        if progress is not None:
+            progress.pages += 1
+        yield text
+
+
+def iter_chunks(
+    pages: Iterable[str], chunk_tokens: int = pdf_chunk_tokens, overlap_tokens: int = pdf_chunk_overlap
+) -> Iterator[str]:
+    """
+    This function splits a stream of texts into chunks of chunk_tokens tokens.
+    Consecutive chunks share overlap_tokens tokens, and chunks may span pages.
+    Cuts are moved back to the nearest character boundary, so a chunk can be a few tokens shorter.
+
+    Args:
+        pages (Iterable[str]): The texts to split.
+        chunk_tokens (int): The number of tokens per chunk.
+        overlap_tokens (int): The number of tokens shared by consecutive chunks.
+
+    Returns:
+        Iterator[str]: The chunks.
+    """
+    if not 0 <= overlap_tokens < chunk_tokens:
+        raise ValueError("overlap_tokens must be at least 0 and smaller than chunk_tokens")
+
+    buffer = []
+    fresh = 0  # tokens of the buffer not yet emitted in a chunk
+    for text in pages:
+        tokens = tokenize(text + "\n")
+        buffer.extend(tokens)
+        fresh += len(tokens)
+        while len(buffer) >= chunk_tokens:
+            # Cut between characters, so no chunk starts or ends with half of one
+            end = character_boundary(buffer, chunk_tokens) or chunk_tokens
+            yield detokenize(buffer[:end])
+            start = character_boundary(buffer, end - overlap_tokens) or end
+            buffer = buffer[start:]
+            fresh = len(buffer) - (end - start)
+    if fresh > 0 and detokenize(buffer).strip():
+        yield detokenize(buffer)
+
+
+def iter_batches(
+    chunks: Iterable[str], max_tokens: int = embedding_batch_tokens, max_size: int = embedding_batch_size
+) -> Iterator[List[str]]:
+    """
+    This function groups chunks into batches bounded by their number and their tokens.
+
+    Args:
+        chunks (Iterable[str]): The chunks.
+        max_tokens (int): The maximum number of tokens per batch.
+        max_size (int): The maximum number of chunks per batch.
+
+    Returns:
+        Iterator[list[str]]: The batches.
+    """
+    batch, tokens = [], 0
+    for chunk in chunks:
+        chunk_tokens = len(tokenize(chunk))
+        if batch and (len(batch) >= max_size or tokens + chunk_tokens > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(chunk)
+        tokens += chunk_tokens
+    if batch:
+        yield batch
+
+
+def ingest_pdf(
+    pdf_path: str,
+    client,
+    *,
+    chunk_tokens: int = pdf_chunk_tokens,
+    overlap_tokens: int = pdf_chunk_overlap,
+    concurrency: int = embedding_concurrency,
+    workers: int = pdf_extract_workers,
+) -> Iterator[Tuple[IngestProgress, EmbeddingBatch]]:
+    """
+    This function embeds a PDF batch by batch, with at most `concurrency` embedding requests in flight.
+    Batches are yielded in document order together with the progress so far.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        client (OpenAIClient): The client for the embeddings.
+        chunk_tokens (int): The number of tokens per chunk.
+        overlap_tokens (int): The number of tokens shared by consecutive chunks.
+        concurrency (int): The maximum number of embedding requests in flight.
+        workers (int): The number of processes extracting the pages of large PDFs.
+
+    Returns:
+        Iterator[tuple[IngestProgress, EmbeddingBatch]]: The progress and the embeddings of each batch.
+    """
+    progress = IngestProgress()
+    # A batch larger than the embedding token bucket would wait for a full bucket and drain it
+    max_tokens = int(min(embedding_batch_tokens, client.limiter.capacity("openai-embeddings", "tokens")))
+    batches = iter_batches(
+        iter_chunks(iter_pages(pdf_path, progress, workers), chunk_tokens, overlap_tokens), max_tokens=max_tokens
+    )
+
+    def embed(batch: List[str], offset: int) -> EmbeddingBatch:
+        data = sorted(client.embeddings(batch).data, key=lambda d: d.index)
+        matrix = np.array([d.embedding for d in data], dtype=np.float32)
+        return EmbeddingBatch(list(range(offset, offset + len(batch))), matrix, batch)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pdf-ingest") as executor:
+        pending = deque()
+        offset = 0
+        for batch in batches:
+            pending.append(executor.submit(embed, batch, offset))
+            offset += len(batch)
+            if len(pending) >= concurrency:
+                embeddings = pending.popleft().result()
+                progress.chunks += len(embeddings)
+                progress.batches += 1
+                yield progress, embeddings
+        while pending:
+            embeddings = pending.popleft().result()
+            progress.chunks += len(embeddings)
+            progress.batches += 1
+            yield progress, embeddings
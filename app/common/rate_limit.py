@@ -0,0 +1,338 @@
+"""
+This module provides token-bucket rate limits for the OpenAI and search API quotas.
+
+Every provider has one or more buckets, e.g. requests per second and tokens per minute for the OpenAI
+completions, with separate buckets for the embeddings, or the daily quota for Naver,
+which is a fixed window reset at the reset time of the provider.
+A request takes from all the buckets of its provider at once.
+The buckets live in memory for one process, or in a SQLite database in WAL mode
+so that several Streamlit or API worker processes share the same budget.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from settings import (
+    rate_limit_backend,
+    rate_limit_path,
+    rate_limit_timeout,
+    openai_rps,
+    openai_tpm,
+    openai_embedding_rps,
+    openai_embedding_tpm,
+    search_rps,
+    naver_daily_quota,
+    kakao_daily_quota,
+    google_daily_quota,
+)
+from common.sqlite_database import SQLiteDatabase
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS rate_limit (
+        name TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
+    )
+    """
+]
+
+
+class RateLimitExceeded(Exception):
+    """
+    This exception is raised when a request does not fit in the budget of its provider before the deadline.
+
+    Attributes:
+        provider (str): The provider of the request.
+        retry_after (float): The seconds until the request would fit.
+    """
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"The rate limit of {provider} is exceeded, retry after {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def day_start(now: float, timezone: str, days: int = 0) -> float:
+    """
+    This function returns the time of the midnight starting the day of a timezone, `days` days later.
+
+    Args:
+        now (float): The current time.
+        timezone (str): The IANA name of the timezone (e.g., 'Asia/Seoul').
+        days (int): The number of days to add (default: 0).
+
+    Returns:
+        float: The time of the midnight.
+    """
+    zone = ZoneInfo(timezone)
+    date = datetime.fromtimestamp(now, zone).date() + timedelta(days=days)
+    return datetime(date.year, date.month, date.day, tzinfo=zone).timestamp()
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """
+    This class is a data class for the settings of a token bucket, or of a daily quota when it has a timezone.
+
+    Attributes:
+        name (str): The unique name of the bucket (e.g., 'openai:tpm').
+        unit (str): What the bucket counts, 'requests' or 'tokens'.
+        capacity (float): The maximum number of units available at once.
+        rate (float): The number of units refilled per second.
+        timezone (str): The timezone of the midnight resetting a daily quota, or None for a token bucket.
+    """
+
+    name: str
+    unit: str
+    capacity: float
+    rate: float
+    timezone: Optional[str] = None
+
+    def refill(self, tokens: float, updated: float, now: float) -> float:
+        """
+        This method returns the units available now, from those available at the last update.
+        """
+        if self.timezone is not None:
+            return self.capacity if updated < day_start(now, self.timezone) else tokens
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def wait(self, missing: float, now: float) -> float:
+        """
+        This method returns the seconds until the missing units are refilled.
+        """
+        if self.timezone is not None:
+            return day_start(now, self.timezone, days=1) - now
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    @classmethod
+    def per_second(cls, name: str, unit: str, amount: float) -> "Bucket":
+        """
+        This method builds a bucket allowing an amount per second, with a burst of one second.
+        """
+        return cls(name, unit, max(amount, 1.0), amount)
+
+    @classmethod
+    def per_minute(cls, name: str, unit: str, amount: float) -> "Bucket":
+        """
+        This method builds a bucket allowing an amount per minute, with a burst of one minute.
+        """
+        return cls(name, unit, amount, amount / 60)
+
+    @classmethod
+    def per_day(cls, name: str, unit: str, amount: float, timezone: str) -> "Bucket":
+        """
+        This method builds a daily quota, available in full again at each midnight of the timezone.
+        """
+        return cls(name, unit, amount, 0.0, timezone)
+
+
+DEFAULT_LIMITS = {
+    "openai": [
+        Bucket.per_second("openai:rps", "requests", openai_rps),
+        Bucket.per_minute("openai:tpm", "tokens", openai_tpm),
+    ],
+    # OpenAI limits every model on its own, and a PDF sends far more embedding tokens than a chat
+    "openai-embeddings": [
+        Bucket.per_second("openai-embeddings:rps", "requests", openai_embedding_rps),
+        Bucket.per_minute("openai-embeddings:tpm", "tokens", openai_embedding_tpm),
+    ],
+    "naver": [
+        Bucket.per_second("naver:rps", "requests", search_rps),
+        Bucket.per_day("naver:daily", "requests", naver_daily_quota, "Asia/Seoul"),
+    ],
+    "kakao": [
+        Bucket.per_second("kakao:rps", "requests", search_rps),
+        Bucket.per_day("kakao:daily", "requests", kakao_daily_quota, "Asia/Seoul"),
+    ],
+    "google": [
+        Bucket.per_second("google:rps", "requests", search_rps),
+        # The Custom Search quota resets at midnight Pacific Time
+        Bucket.per_day("google:daily", "requests", google_daily_quota, "America/Los_Angeles"),
+    ],
+}
+
+
+def take(states: Dict[str, Tuple[float, float]], costs: Dict[Bucket, float], now: float) -> float:
+    """
+    This function refills the buckets and takes the costs from all of them, or from none.
+    A cost larger than its bucket waits for a full bucket and empties it, so the bucket never goes into a debt
+    that takes longer than a full refill to pay back.
+
+    Args:
+        states (dict): The (available units, update time) of the buckets by name, updated in place.
+        costs (dict): The units to take from each bucket.
+        now (float): The current time.
+
+    Returns:
+        float: 0 if the costs were taken, otherwise the seconds until they fit.
+    """
+    wait = 0.0
+    available = {}
+    for bucket, cost in costs.items():
+        tokens, updated = states.get(bucket.name, (bucket.capacity, now))
+        available[bucket] = bucket.refill(tokens, updated, now)
+        # A request larger than the bucket only waits for a full bucket
+        missing = min(cost, bucket.capacity) - available[bucket]
+        if missing > 0:
+            wait = max(wait, bucket.wait(missing, now))
+    if wait > 0:
+        return wait
+    for bucket, cost in costs.items():
+        states[bucket.name] = (available[bucket] - min(cost, bucket.capacity), now)
+    return 0.0
+
+
+class MemoryBuckets:
+    """
+    This class keeps the buckets in memory, shared by the threads of one process.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def take(self, costs: Dict[Bucket, float]) -> float:
+        """
+        This method takes the costs from the buckets, see take.
+        """
+        with self._lock:
+            return take(self._states, costs, time.time())
+
+    def states(self) -> Dict[str, Tuple[float, float]]:
+        """
+        This method returns the (available units, update time) of the buckets by name.
+        """
+        with self._lock:
+            return dict(self._states)
+
+
+class SQLiteBuckets:
+    """
+    This class keeps the buckets in a SQLite database, shared by the threads and processes of the host.
+
+    Attributes:
+        database (SQLiteDatabase): The SQLite database of the buckets.
+    """
+
+    def __init__(self, path: str = rate_limit_path):
+        self.database = SQLiteDatabase(path, SCHEMA)
+
+    def take(self, costs: Dict[Bucket, float]) -> float:
+        """
+        This method takes the costs from the buckets in one transaction, see take.
+        """
+        names = [bucket.name for bucket in costs]
+        with self.database.transaction() as connection:
+            rows = connection.execute(
+                f"SELECT name, tokens, updated FROM rate_limit WHERE name IN ({', '.join('?' * len(names))})", names
+            ).fetchall()
+            states = {name: (tokens, updated) for name, tokens, updated in rows}
+            wait = take(states, costs, time.time())
+            if wait == 0:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO rate_limit VALUES (?, ?, ?)",
+                    [(name, *states[name]) for name in names],
+                )
+        return wait
+
+    def states(self) -> Dict[str, Tuple[float, float]]:
+        """
+        This method returns the (available units, update time) of the buckets by name.
+        """
+        rows = self.database.connection().execute("SELECT name, tokens, updated FROM rate_limit").fetchall()
+        return {name: (tokens, updated) for name, tokens, updated in rows}
+
+
+class RateLimiter:
+    """
+    This class admits the requests of each provider within its token buckets.
+
+    Attributes:
+        limits (dict): The buckets of each provider.
+        backend (MemoryBuckets | SQLiteBuckets): The storage of the buckets.
+        timeout (float): The default seconds a request may wait for its budget.
+    """
+
+    def __init__(self, limits: Dict[str, List[Bucket]] = None, backend=None, timeout: float = rate_limit_timeout):
+        self.limits = DEFAULT_LIMITS if limits is None else limits
+        if backend is None:
+            backend = SQLiteBuckets() if rate_limit_backend == "sqlite" else MemoryBuckets()
+        self.backend = backend
+        self.timeout = timeout
+
+    def acquire(self, provider: str, requests: int = 1, tokens: int = 0, timeout: float = None):
+        """
+        This method waits until the request fits in the budget of the provider and takes it.
+
+        Args:
+            provider (str): The provider of the request (e.g., 'openai').
+            requests (int): The number of requests (default: 1).
+            tokens (int): The number of tokens of the request, for the buckets counting tokens (default: 0).
+            timeout (float): The seconds to wait at most. 0 rejects at once (default: self.timeout).
+
+        Raises:
+            RateLimitExceeded: If the request does not fit before the deadline.
+        """
+        costs = {
+            bucket: requests if bucket.unit == "requests" else tokens
+            for bucket in self.limits.get(provider, [])
+            if (requests if bucket.unit == "requests" else tokens) > 0
+        }
+        if not costs:
+            return
+
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            wait = self.backend.take(costs)
+            if wait == 0:
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise RateLimitExceeded(provider, wait)
+            time.sleep(wait)
+
+    def capacity(self, provider: str, unit: str) -> float:
+        """
+        This method returns the largest cost in a unit that the buckets of a provider admit at once.
+        Callers split larger requests, since a request larger than a bucket waits for all of it.
+
+        Args:
+            provider (str): The provider (e.g., 'openai-embeddings').
+            unit (str): The unit, 'requests' or 'tokens'.
+
+        Returns:
+            float: The smallest capacity of the buckets counting the unit, or infinity if none does.
+        """
+        capacities = [bucket.capacity for bucket in self.limits.get(provider, []) if bucket.unit == unit]
+        return min(capacities, default=float("inf"))
+
+    def usage(self) -> dict:
+        """
+        This method reports the current budget of every bucket.
+
+        Returns:
+            dict: For each provider and bucket, the unit, capacity, available units and used fraction.
+        """
+        states = self.backend.states()
+        now = time.time()
+        report = {}
+        for provider, buckets in self.limits.items():
+            report[provider] = {}
+            for bucket in buckets:
+                tokens, updated = states.get(bucket.name, (bucket.capacity, now))
+                available = max(0.0, bucket.refill(tokens, updated, now))
+                report[provider][bucket.name] = {
+                    "unit": bucket.unit,
+                    "capacity": bucket.capacity,
+                    "available": round(available, 2),
+                    "used": round(1 - available / bucket.capacity, 4) if bucket.capacity else 0.0,
+                }
+        return report
+
+
+rate_limiter = RateLimiter()
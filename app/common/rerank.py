@@ -0,0 +1,139 @@
+"""
+This module reranks merged search results by relevance to the question before they go into a prompt.
+
+When the embeddings fail, the results keep the order of their providers, within the same limits.
+"""
+
+import json
+import logging
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from settings import rerank_top_k, rerank_token_cap, rerank_duplicate_threshold
+from common.client import OpenAIClient, get_openai_client
+from common.metrics import stage_errors
+from common.search_result import SearchResult
+from common.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """
+    This class embeds the question and the items in one call, drops near-duplicates
+    and keeps the most relevant items within a token cap.
+
+    Attributes:
+        top_k (int): The maximum number of items returned.
+        token_cap (int): The maximum number of tokens of the returned items.
+        duplicate_threshold (float): The cosine similarity above which two items are duplicates.
+        client (OpenAIClient): The client for the embeddings (default: the shared client).
+    """
+
+    def __init__(
+        self,
+        top_k: int = rerank_top_k,
+        token_cap: int = rerank_token_cap,
+        duplicate_threshold: float = rerank_duplicate_threshold,
+        client: OpenAIClient = None,
+    ):
+        self.top_k = top_k
+        self.token_cap = token_cap
+        self.duplicate_threshold = duplicate_threshold
+        self.client = client
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        This method embeds the texts in one batched call.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: The unit embeddings, one row per text.
+        """
+        return (self.client or get_openai_client()).unit_embeddings(texts)
+
+    def rerank(self, question: str, results: List[SearchResult]) -> List[SearchResult]:
+        """
+        This method returns the most relevant results for the question.
+
+        Args:
+            question (str): The question asked by the user.
+            results (list[SearchResult]): The search results of every provider.
+
+        Returns:
+            list[SearchResult]: The kept results, most relevant first.
+        """
+        if not results:
+            return []
+
+        try:
+            vectors = self.embed([question] + [result.text for result in results])
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning("rerank embedding failed, keeping the provider order: %s", e)
+            stage_errors.inc(stage="rerank.embed")
+            return self.select(results, provider_order(results))
+        scores = vectors[1:] @ vectors[0]
+        return self.select(results, np.argsort(-scores), vectors[1:] @ vectors[1:].T)
+
+    def select(
+        self, results: List[SearchResult], order: Iterable[int], similarities: Optional[np.ndarray] = None
+    ) -> List[SearchResult]:
+        """
+        This method keeps the results in the given order within top_k and the token cap.
+
+        Args:
+            results (list[SearchResult]): The search results of every provider.
+            order (Iterable[int]): The indices of the results, most relevant first.
+            similarities (np.ndarray): The cosine similarities between the results, or None to keep duplicates.
+
+        Returns:
+            list[SearchResult]: The kept results, in the given order.
+        """
+        kept = []
+        tokens = 0
+        for i in order:
+            if similarities is not None and kept and similarities[i, kept].max() >= self.duplicate_threshold:
+                continue
+            cost = count_tokens(json.dumps(results[i].to_prompt(), ensure_ascii=False))
+            if tokens + cost > self.token_cap:
+                continue
+            kept.append(i)
+            tokens += cost
+            if len(kept) >= self.top_k:
+                break
+        return [results[i] for i in kept]
+
+
+def provider_order(results: List[SearchResult]) -> List[int]:
+    """
+    This function interleaves the results of the providers, first results first.
+
+    Args:
+        results (list[SearchResult]): The search results of every provider, each provider in its own order.
+
+    Returns:
+        list[int]: The indices of the results, by rank within their provider.
+    """
+    ranks = {}
+    keys = []
+    for i, result in enumerate(results):
+        rank = ranks[result.source] = ranks.get(result.source, -1) + 1
+        keys.append((rank, i))
+    return [i for _, i in sorted(keys)]
+
+
+def rerank_items(question: str, results: List[SearchResult]) -> List[SearchResult]:
+    """
+    This function returns the most relevant results for the question with the default settings.
+
+    Args:
+        question (str): The question asked by the user.
+        results (list[SearchResult]): The search results of every provider.
+
+    Returns:
+        list[SearchResult]: The kept results, most relevant first.
+    """
+    return Reranker().rerank(question, results)
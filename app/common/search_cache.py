@@ -0,0 +1,209 @@
+"""
+This module provides a disk-backed cache for the search API responses.
+
+The cache is a SQLite database in WAL mode, so several Streamlit worker processes can share it.
+The cache is best-effort: a database error is logged and counted, and the lookup is a miss.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from settings import search_cache_path, search_cache_size, search_cache_ttl, search_cache_recent_ttl
+from common.sqlite_database import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+# Seconds a response stays fresh, by provider
+SEARCH_CACHE_TTLS = {
+    "naver": search_cache_ttl,
+    "kakao": search_cache_ttl,
+    "google": search_cache_ttl * 6,
+}
+
+# Sort parameters asking for the latest results, which go stale quickly
+RECENT_SORTS = ("date", "recency")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS search_cache (
+        key TEXT PRIMARY KEY,
+        provider TEXT NOT NULL,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS search_cache_last_access ON search_cache (last_access)",
+]
+
+
+def normalize_query(query: str) -> str:
+    """
+    This function normalizes a search query for the cache key.
+
+    Args:
+        query (str): The search query.
+
+    Returns:
+        str: The query in lower case with collapsed whitespace.
+    """
+    return " ".join(str(query).lower().split())
+
+
+class SearchCache:
+    """
+    This class is a size-bounded LRU cache of search responses with per-provider TTLs.
+    Lookups only read the database: the access times of the hits are kept in memory
+    and written with the next response stored by this process, before the eviction.
+
+    Attributes:
+        database (SQLiteDatabase): The SQLite database of the cache.
+        max_entries (int): The maximum number of responses kept.
+        hits (int): The number of lookups served from the cache in this process.
+        misses (int): The number of lookups not found in the cache in this process.
+        errors (int): The number of reads and writes that failed in this process.
+    """
+
+    def __init__(self, path: str = search_cache_path, max_entries: int = search_cache_size):
+        self.database = SQLiteDatabase(path, SCHEMA)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._touched = {}  # key -> access time of a hit, not written yet
+        self._lock = threading.Lock()
+
+    def _failed(self, operation: str, error: sqlite3.Error):
+        with self._lock:
+            self.errors += 1
+        logger.warning("search cache %s failed: %s", operation, error)
+
+    @staticmethod
+    def key(provider: str, url: str, params: dict) -> str:
+        """
+        This method builds the cache key of a search request.
+
+        Args:
+            provider (str): The search provider (e.g., 'naver').
+            url (str): The endpoint url.
+            params (dict): The query parameters.
+
+        Returns:
+            str: The cache key.
+        """
+        params = {
+            name: normalize_query(value) if name in ("query", "q") else value for name, value in (params or {}).items()
+        }
+        raw = json.dumps([provider, url, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def ttl(provider: str, params: dict) -> int:
+        """
+        This method returns how long a response stays fresh.
+
+        Args:
+            provider (str): The search provider (e.g., 'naver').
+            params (dict): The query parameters.
+
+        Returns:
+            int: The TTL in seconds.
+        """
+        if (params or {}).get("sort") in RECENT_SORTS:
+            return search_cache_recent_ttl
+        return SEARCH_CACHE_TTLS.get(provider, search_cache_ttl)
+
+    def get(self, provider: str, url: str, params: dict) -> Optional[dict]:
+        """
+        This method returns the cached response of a search request.
+
+        Args:
+            provider (str): The search provider (e.g., 'naver').
+            url (str): The endpoint url.
+            params (dict): The query parameters.
+
+        Returns:
+            dict: The cached response, or None if it is missing, expired or cannot be read.
+        """
+        key = self.key(provider, url, params)
+        now = time.time()
+        try:
+            row = (
+                self.database.connection()
+                .execute("SELECT value, expires_at FROM search_cache WHERE key = ?", (key,))
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            self._failed("read", e)
+            return None
+        with self._lock:
+            if row is None or row[1] < now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = now
+        return json.loads(row[0])
+
+    def set(self, provider: str, url: str, params: dict, value: dict):
+        """
+        This method stores the response of a search request and evicts the least recently used ones.
+        If the database is busy or fails, the response is not stored.
+
+        Args:
+            provider (str): The search provider (e.g., 'naver').
+            url (str): The endpoint url.
+            params (dict): The query parameters.
+            value (dict): The response to store.
+        """
+        key = self.key(provider, url, params)
+        now = time.time()
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        try:
+            with self.database.transaction() as connection:
+                connection.executemany(
+                    "UPDATE search_cache SET last_access = MAX(last_access, ?) WHERE key = ?",
+                    [(accessed, hit) for hit, accessed in touched.items()],
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, provider, json.dumps(value, ensure_ascii=False), now + self.ttl(provider, params), now),
+                )
+                connection.execute("DELETE FROM search_cache WHERE expires_at < ?", (now,))
+                connection.execute(
+                    """
+                    DELETE FROM search_cache WHERE key IN (
+                        SELECT key FROM search_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            # Keep the access times for the next write
+            with self._lock:
+                for hit, accessed in touched.items():
+                    self._touched.setdefault(hit, accessed)
+            self._failed("write", e)
+
+    def stats(self) -> dict:
+        """
+        This method reports the hit, miss and error counters and the number of cached responses.
+
+        Returns:
+            dict: The hits, misses, errors and entries of the cache. Entries is None if the database cannot be read.
+        """
+        try:
+            entries = self.database.connection().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        except sqlite3.Error as e:
+            self._failed("read", e)
+            entries = None
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "errors": self.errors, "entries": entries}
+
+
+search_cache = SearchCache()
@@ -0,0 +1,207 @@
+"""
+This file normalizes the Naver, Kakao and Google search responses into compact SearchResult records.
+
+Only the fields the answer needs are kept, and the markup and HTML entities are stripped
+from each of these fields only, so the results are small in memory and in the prompt.
+"""
+
+import html
+import re
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+TAGS = re.compile(r"<[^>]*>")
+
+
+def clean_text(value) -> str:
+    """
+    This function strips the tags, decodes the entities and collapses the whitespace of a field.
+    Tags are stripped before the entities are decoded, so an escaped '&lt;b&gt;' stays as text.
+
+    Args:
+        value: The raw field, or None.
+
+    Returns:
+        str: The plain text.
+    """
+    if not value:
+        return ""
+    value = TAGS.sub("", str(value))
+    if "&" in value:
+        value = html.unescape(value)
+    return " ".join(value.split())
+
+
+@lru_cache(maxsize=1024)
+def parse_date(value) -> Optional[str]:
+    """
+    This function normalizes the date formats of the providers to YYYY-MM-DD.
+
+    Args:
+        value: 'Mon, 01 Jan 2024 09:00:00 +0900', '20240101' or '2024-01-01T09:00:00.000+09:00'.
+
+    Returns:
+        str: The date, the raw value if it is not recognized, or None without a value.
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    if len(value) == 8 and value.isdigit():
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    if len(value) >= 10 and value[4] == "-" and value[7] == "-":
+        return value[:10]
+    try:
+        return parsedate_to_datetime(value).date().isoformat()
+    except (TypeError, ValueError):
+        return value
+
+
+class SearchResult:
+    """
+    This class is a slotted record of one search result.
+
+    Attributes:
+        title (str): The plain title.
+        snippet (str): The plain summary of the page.
+        url (str): The link to the page.
+        source (str): The provider, 'naver', 'kakao' or 'google'.
+        published_at (str): The publication date as YYYY-MM-DD, or None.
+    """
+
+    __slots__ = ("title", "snippet", "url", "source", "published_at")
+
+    def __init__(self, title: str, snippet: str, url: str, source: str, published_at: str = None):
+        self.title = title
+        self.snippet = snippet
+        self.url = url
+        self.source = source
+        self.published_at = published_at
+
+    @property
+    def text(self) -> str:
+        """
+        The title and the snippet, as embedded by the reranker.
+        """
+        return f"{self.title}\n{self.snippet}".strip() or self.url or "-"
+
+    def to_dict(self) -> dict:
+        """
+        This method is used to convert the result to a dictionary.
+
+        Returns:
+            dict: The fields of the result.
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_prompt(self) -> dict:
+        """
+        This method returns the fields of the result the answer needs, without the empty ones.
+
+        Returns:
+            dict: The title, snippet, url and date of the result.
+        """
+        prompt = {"title": self.title, "snippet": self.snippet, "url": self.url}
+        if self.published_at:
+            prompt["date"] = self.published_at
+        return prompt
+
+    def __eq__(self, other):
+        if not isinstance(other, SearchResult):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"SearchResult(source={self.source!r}, title={self.title[:30]!r}, url={self.url!r})"
+
+
+def parse_naver(response: dict) -> List[SearchResult]:
+    """
+    This function parses a Naver search response.
+
+    Args:
+        response (dict): The raw response of any Naver search service.
+
+    Returns:
+        list[SearchResult]: The results.
+    """
+    return [
+        SearchResult(
+            clean_text(item.get("title")),
+            clean_text(item.get("description")),
+            item.get("link") or item.get("originallink") or "",
+            "naver",
+            parse_date(item.get("pubDate") or item.get("postdate") or item.get("pubdate")),
+        )
+        for item in response.get("items") or []
+    ]
+
+
+def parse_kakao(response: dict) -> List[SearchResult]:
+    """
+    This function parses a Kakao search response.
+
+    Args:
+        response (dict): The raw response of any Kakao search service.
+
+    Returns:
+        list[SearchResult]: The results.
+    """
+    return [
+        SearchResult(
+            clean_text(item.get("title")),
+            clean_text(item.get("contents")),
+            item.get("url") or "",
+            "kakao",
+            parse_date(item.get("datetime")),
+        )
+        for item in response.get("documents") or []
+    ]
+
+
+def parse_google(response: dict) -> List[SearchResult]:
+    """
+    This function parses a Google Custom Search response.
+
+    Args:
+        response (dict): The raw response of the Custom Search API.
+
+    Returns:
+        list[SearchResult]: The results.
+    """
+    results = []
+    for item in response.get("items") or []:
+        metatags = ((item.get("pagemap") or {}).get("metatags") or [{}])[0]
+        results.append(
+            SearchResult(
+                clean_text(item.get("title")),
+                clean_text(item.get("snippet")),
+                item.get("link") or "",
+                "google",
+                parse_date(metatags.get("article:published_time")),
+            )
+        )
+    return results
+
+
+PARSERS: Dict[str, Callable[[dict], List[SearchResult]]] = {
+    "naver": parse_naver,
+    "kakao": parse_kakao,
+    "google": parse_google,
+}
+
+
+def parse_results(source: str, response: dict) -> List[SearchResult]:
+    """
+    This function parses the search response of a provider.
+
+    Args:
+        source (str): The provider, 'naver', 'kakao' or 'google'.
+        response (dict): The raw response, or None.
+
+    Returns:
+        list[SearchResult]: The results.
+    """
+    if not response:
+        return []
+    return PARSERS[source](response)
@@ -0,0 +1,62 @@
+"""
+This module loads the API secrets once per process.
+
+Values in secret.yaml can be overridden by environment variables.
+"""
+
+import os
+from functools import lru_cache
+
+import yaml
+
+from settings import secret_path
+
+SECRET_ENV_VARS = {
+    ("openai", "api_key"): "OPENAI_API_KEY",
+    ("naver", "client_id"): "NAVER_CLIENT_ID",
+    ("naver", "client_secret"): "NAVER_CLIENT_SECRET",
+    ("kakao", "api_key"): "KAKAO_API_KEY",
+    ("google", "cx"): "GOOGLE_CX",
+    ("google", "key"): "GOOGLE_KEY",
+}
+
+
+@lru_cache(maxsize=None)
+def load_secret(path: str = secret_path) -> dict:
+    """
+    This function loads the secrets from the secret file and the environment variables.
+
+    Args:
+        path (str): The path to the secret file (default: settings.secret_path).
+
+    Returns:
+        dict: The secrets by section, e.g. {"openai": {"api_key": ...}}.
+    """
+    secret = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            secret = yaml.safe_load(f) or {}
+
+    for (section, key), env_var in SECRET_ENV_VARS.items():
+        if os.getenv(env_var):
+            secret.setdefault(section, {})[key] = os.getenv(env_var)
+    return secret
+
+
+def get_secret(section: str, key: str) -> str:
+    """
+    This function returns one secret value.
+
+    Args:
+        section (str): The section of the secret (e.g., 'openai').
+        key (str): The key of the secret (e.g., 'api_key').
+
+    Returns:
+        str: The secret value.
+    """
+    try:
+        return load_secret()[section][key]
+    except KeyError as e:
+        raise KeyError(
+            f"Missing secret {section}.{key}: set it in {secret_path} or {SECRET_ENV_VARS.get((section, key))}"
+        ) from e
@@ -0,0 +1,196 @@
+"""
+This module provides a semantic cache for the classifier prompts.
+
+Classifier answers come from a tiny closed set, so paraphrased questions can reuse the answer
+of a previous question whose embedding is similar enough. When the embedding fails, the lookup
+falls back to the exact text, so the classifier still answers.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Optional
+
+import numpy as np
+
+from settings import semantic_cache_threshold, semantic_cache_size
+from common.metrics import cache_lookups, stage_errors
+from common.search_cache import normalize_query
+from common.single_flight import SingleFlight, llm_flights
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    This class is a bounded LRU cache looked up by exact text first and by embedding similarity second.
+
+    Attributes:
+        threshold (float): The minimum cosine similarity for a semantic hit. 1.0 or more disables it.
+        max_entries (int): The maximum number of answers kept.
+        hits (int): The number of exact hits.
+        semantic_hits (int): The number of hits by embedding similarity.
+        misses (int): The number of lookups not found.
+    """
+
+    def __init__(self, threshold: float = semantic_cache_threshold, max_entries: int = semantic_cache_size):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # text -> (slot, value)
+        self._slots = [None] * max_entries  # slot -> text
+        self._vectors = None  # (max_entries, dim) matrix of unit vectors
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self) -> bool:
+        """
+        Whether lookups fall back to embedding similarity.
+        """
+        return self.threshold < 1.0
+
+    def get(self, text: str) -> Optional[str]:
+        """
+        This method returns the answer cached for exactly the same text.
+
+        Args:
+            text (str): The normalized text.
+
+        Returns:
+            str: The cached answer, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(text)
+            if entry is None:
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+            return entry[1]
+
+    def get_similar(self, vector: Optional[np.ndarray]) -> Optional[str]:
+        """
+        This method returns the answer cached for the most similar text above the threshold.
+
+        Args:
+            vector (np.ndarray): The unit embedding of the text, or None to only count the miss.
+
+        Returns:
+            str: The cached answer, or None.
+        """
+        with self._lock:
+            if vector is not None and self._vectors is not None and self._entries:
+                scores = self._vectors @ vector
+                slot = int(np.argmax(scores))
+                text = self._slots[slot]
+                if text is not None and scores[slot] >= self.threshold:
+                    self._entries.move_to_end(text)
+                    self.semantic_hits += 1
+                    return self._entries[text][1]
+            self.misses += 1
+            return None
+
+    def set(self, text: str, value: str, vector: np.ndarray = None):
+        """
+        This method stores an answer, evicting the least recently used one when full.
+
+        Args:
+            text (str): The normalized text.
+            value (str): The answer.
+            vector (np.ndarray): The unit embedding of the text.
+        """
+        with self._lock:
+            if text in self._entries:
+                slot = self._entries.pop(text)[0]
+            elif len(self._entries) >= self.max_entries:
+                _, (slot, _) = self._entries.popitem(last=False)
+            else:
+                slot = self._slots.index(None)
+            self._entries[text] = (slot, value)
+            self._slots[slot] = text
+            if vector is not None:
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._vectors[slot] = vector
+            elif self._vectors is not None:
+                self._vectors[slot] = 0.0
+
+    def stats(self) -> dict:
+        """
+        This method reports the counters of the cache.
+
+        Returns:
+            dict: The hits, semantic hits, misses and entries of the cache.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+def semantic_cached(embed: Callable[[str], np.ndarray], cache: SemanticCache = None, flights: SingleFlight = None):
+    """
+    This function returns a decorator caching a classifier of one text argument in a SemanticCache.
+    Concurrent misses for the same text share one call of the classifier.
+
+    Args:
+        embed (Callable): The function returning the unit embedding of a text.
+        cache (SemanticCache): The cache to use (default: a new cache from the settings).
+        flights (SingleFlight): The coalescing layer of the misses (default: single_flight.llm_flights).
+
+    Returns:
+        Callable: The decorator. The decorated function exposes its cache as `.cache`
+            and the exact lookup, which needs no embedding, as `.cached(query)`.
+    """
+
+    def decorator(func):
+        func_cache = cache or SemanticCache()
+        func_flights = flights or llm_flights
+
+        def embed_or_none(text):
+            if not func_cache.semantic:
+                return None
+            try:
+                return embed(text)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Rate limited or unavailable: skip the similarity lookup and keep the answer by exact text only
+                logger.warning("semantic cache embedding of %s failed: %s", func.__name__, e)
+                stage_errors.inc(stage="semantic_cache.embed", cache=func.__name__)
+                return None
+
+        def miss(query, text):
+            vector = embed_or_none(text)
+            value = func_cache.get_similar(vector)
+            if value is not None:
+                cache_lookups.inc(cache=func.__name__, result="semantic_hit")
+                return value
+
+            cache_lookups.inc(cache=func.__name__, result="miss")
+            value = func(query)
+            func_cache.set(text, value, vector)
+            return value
+
+        def cached(query):
+            value = func_cache.get(normalize_query(query))
+            if value is not None:
+                cache_lookups.inc(cache=func.__name__, result="hit")
+            return value
+
+        @wraps(func)
+        def wrapper(query):
+            value = cached(query)
+            if value is not None:
+                return value
+            text = normalize_query(query)
+            return func_flights.do((func.__qualname__, text), lambda: miss(query, text))
+
+        wrapper.cache = func_cache
+        wrapper.cached = cached
+        return wrapper
+
+    return decorator
@@ -0,0 +1,111 @@
+"""
+This module coalesces identical concurrent requests into a single upstream call.
+
+When many sessions ask the same question at once, only the first caller of a key runs the call.
+The others wait for it and share its result or its exception.
+"""
+
+import threading
+from typing import Any, Callable, Hashable
+
+
+class _Flight:
+    """
+    This class holds the outcome of one in-flight call.
+    """
+
+    def __init__(self):
+        self.leader = threading.current_thread()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def settle(self, result: Any = None, error: Exception = None):
+        """
+        This method records the outcome of the call and wakes up the waiting callers.
+
+        Args:
+            result (Any): The result of the call.
+            error (Exception): The exception raised by the call.
+        """
+        self.result = result
+        self.error = error
+        self.done.set()
+
+    def outcome(self) -> Any:
+        """
+        This method waits for the call and returns its result, raising its exception if it failed.
+
+        Returns:
+            Any: The result of the call.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    This class runs at most one call per key at a time and shares its outcome with concurrent callers.
+
+    Attributes:
+        issued (int): The number of calls run upstream.
+        coalesced (int): The number of callers served by a call already in flight.
+    """
+
+    def __init__(self):
+        self.issued = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        This method runs the function, or waits for the call in flight with the same key.
+
+        Args:
+            key (Hashable): The normalized key of the request.
+            func (Callable): The function running the request.
+
+        Returns:
+            Any: The result of the call, shared by every concurrent caller of the key.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                flight = self._flights[key] = _Flight()
+                self.issued += 1
+        if flight.leader is not threading.current_thread():
+            return flight.outcome()
+
+        result, error = None, None
+        try:
+            result = func()
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.settle(result, error)
+
+    def stats(self) -> dict:
+        """
+        This method reports the counters of the calls.
+
+        Returns:
+            dict: The issued and coalesced calls and the calls in flight.
+        """
+        with self._lock:
+            return {"issued": self.issued, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+# Coalesces the provider search requests
+search_flights = SingleFlight()
+
+# Coalesces the classifier and planner calls to the OpenAI API
+llm_flights = SingleFlight()
@@ -0,0 +1,64 @@
+"""
+This module opens the SQLite databases shared by the threads and worker processes of the host.
+
+The search cache, the rate limit buckets and the conversation store each keep a database in WAL mode,
+with one connection per thread and short write transactions.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+
+
+class SQLiteDatabase:
+    """
+    This class opens a thread-local connection to a SQLite database and creates its tables on first use.
+
+    Attributes:
+        path (str): The path to the SQLite database.
+        schema (list[str]): The statements creating the tables and indexes, which must be idempotent.
+        timeout (float): The seconds a statement waits for a lock held by another connection.
+    """
+
+    def __init__(self, path: str, schema: Sequence[str], timeout: float = 5):
+        self.path = path
+        self.schema = list(schema)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        This method returns the connection of the current thread, opening it if needed.
+
+        Returns:
+            sqlite3.Connection: The connection, in autocommit mode.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.schema:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        This method runs the statements of the block in a write transaction, rolled back if the block raises.
+
+        Yields:
+            sqlite3.Connection: The connection of the current thread.
+        """
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
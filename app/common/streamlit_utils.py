@@ -1,20 +1,140 @@
 """
 This module provides utility functions for Streamlit applications.
 
-It includes functions for displaying chat history and getting user input.
+It includes functions for displaying chat history and getting user input,
+for keeping shared and per-session objects and stored histories across reruns, and for the metrics debug panel.
 """
 
+import hashlib
+import uuid
+
 import streamlit as st
 
+from settings import history_display_window, history_display_page
+from common.client import OpenAIClient, get_openai_client, openai_clients
+from common.conversation_store import ANONYMOUS_PREFIX, StoredHistory, conversations
+from common.metrics import registry, stage_duration, stage_errors, openai_tokens, cache_lookups
+from common.transport import get_transport
+
+
+@st.cache_resource
+def shared_openai_client() -> OpenAIClient:
+    """
+    Returns the OpenAI client shared by every session, created once per process.
+
+    Returns:
+        OpenAIClient: The shared client.
+    """
+    return get_openai_client()
+
+
+def session_object(key, factory):
+    """
+    Returns an object of the current session, creating it only on the first run of the session.
+
+    Args:
+        key (str): The session_state key of the object.
+        factory (Callable): The function creating the object.
+
+    Returns:
+        The object of the session.
+    """
+    if key not in st.session_state:
+        st.session_state[key] = factory()
+    return st.session_state[key]
+
+
+def _session_owner() -> str:
+    """
+    Returns the owner of the stored conversations of the current session, never taken from the URL.
+    A user signed in with st.login owns them across sessions and restarts. Otherwise the owner is a random id
+    kept in the session only, so the conversation is stored and bounded in memory but not resumed,
+    and it is deleted once idle for CONVERSATION_ANONYMOUS_RETENTION_HOURS.
+    """
+    user = st.user
+    subject = user.get("sub") or user.get("email") if user.get("is_logged_in") else None
+    if subject:
+        return "user:" + hashlib.sha256(f"{user.get('iss')}:{subject}".encode()).hexdigest()
+    return session_object("session_owner", lambda: ANONYMOUS_PREFIX + uuid.uuid4().hex)
+
+
+def session_history(key) -> StoredHistory:
+    """
+    Returns a stored chat history of the current session.
+
+    Args:
+        key (str): The session_state key of the history.
+
+    Returns:
+        StoredHistory: The history of the session.
+    """
+    return session_object(key, lambda: conversations.history(f"{_session_owner()}:{key}"))
+
+
+def _page_block(chat_history, page, page_size, hidden_roles, key):
+    """
+    Returns the markdown of a full page of earlier messages, built once per page.
+    Full pages never change while the history only grows, so their markdown is cached in the session.
+    """
+    start, stop = page * page_size, (page + 1) * page_size
+    blocks = st.session_state.setdefault(f"{key}_blocks", {})
+    if isinstance(chat_history, StoredHistory):
+        # Stored messages are read again as new objects, but a stored conversation is append-only
+        fingerprint = chat_history.conversation
+    else:
+        fingerprint = (id(chat_history), id(chat_history[start]), id(chat_history[stop - 1]))
+    cached = blocks.get(page)
+    if cached is None or cached[0] != fingerprint:
+        block = "\n\n---\n\n".join(
+            f"**{content['role']}**\n\n{content['content']}"
+            for content in chat_history[start:stop]
+            if content["role"] not in hidden_roles
+        )
+        cached = blocks[page] = (fingerprint, block)
+    return cached[1]
+
 
-def display_chat_history(chat_history):
+def display_chat_history(
+    chat_history,
+    window=history_display_window,
+    page_size=history_display_page,
+    hidden_roles=("system",),
+    key="chat_history",
+):
     """
-    Displays the chat history in the Streamlit app.
+    Displays the most recent chat messages in the Streamlit app, with a button to load earlier pages.
+
+    Only the last `window` to `window + page_size` messages are drawn as chat messages, so the cost of a
+    rerun does not grow with the conversation. Earlier messages are loaded a page at a time on demand
+    and each page is drawn as one cached markdown block.
 
     Args:
         chat_history (list): The list of chat messages to display.
+        window (int): The minimum number of recent messages shown (default: settings.history_display_window).
+        page_size (int): The number of messages per earlier page (default: settings.history_display_page).
+        hidden_roles (tuple): The roles of the messages not shown (default: system messages).
+        key (str): The session_state key prefix of the pager, unique per history on a page.
     """
-    for content in chat_history:
+    boundary = max(0, len(chat_history) - window)
+    boundary -= boundary % page_size
+    pages = boundary // page_size
+    loaded_key = f"{key}_loaded_pages"
+    loaded = min(st.session_state.get(loaded_key, 0), pages)
+
+    if loaded < pages:
+
+        def load_earlier():
+            st.session_state[loaded_key] = loaded + 1
+
+        st.button(f"이전 메시지 더 보기 ({boundary - loaded * page_size})", key=f"{key}_load", on_click=load_earlier)
+
+    for page in range(pages - loaded, pages):
+        with st.container(border=True):
+            st.markdown(_page_block(chat_history, page, page_size, hidden_roles, key))
+
+    for content in chat_history[boundary:]:
+        if content["role"] in hidden_roles:
+            continue
         with st.chat_message(content["role"]):
             st.markdown(content["content"])
 
@@ -30,3 +150,51 @@ def talk(text, role, history):
     """
     st.markdown(text)
     history.append({"role": role, "content": text})
+
+
+def talk_stream(stream, role, history):
+    """
+    Displays a streamed message in the Streamlit app as it arrives and updates the chat history.
+
+    Args:
+        stream (Iterator[str]): The pieces of the message text.
+        role (str): The role of the speaker (e.g., 'user' or 'assistant').
+        history (list): The chat history to update with the full message.
+
+    Returns:
+        str: The full message text.
+    """
+    text = st.write_stream(stream)
+    history.append({"role": role, "content": text})
+    return text
+
+
+def display_metrics_panel():
+    """
+    Displays the latency, error, token and cache metrics of the process in the sidebar,
+    with the live OpenAI clients and the pooled connections.
+    """
+    with st.sidebar.expander("Metrics", expanded=False):
+        errors = {dict(labels).get("stage"): count for labels, count in stage_errors.values().items()}
+        st.dataframe(
+            [
+                {
+                    **dict(labels),
+                    "count": summary["count"],
+                    "mean (ms)": round(summary["mean"] * 1000, 1),
+                    "errors": errors.get(dict(labels).get("stage"), 0),
+                }
+                for labels, summary in sorted(stage_duration.summary().items())
+            ],
+            hide_index=True,
+        )
+        st.dataframe(
+            [{**dict(labels), "tokens": count} for labels, count in sorted(openai_tokens.values().items())],
+            hide_index=True,
+        )
+        st.dataframe(
+            [{**dict(labels), "lookups": count} for labels, count in sorted(cache_lookups.values().items())],
+            hide_index=True,
+        )
+        st.json({"openai_clients": openai_clients.stats(), "search_connections": get_transport().stats()})
+        st.download_button("Prometheus", registry.render(), file_name="metrics.txt")
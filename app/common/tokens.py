@@ -0,0 +1,123 @@
+"""
+This module counts tokens locally.
+
+It uses tiktoken when it is installed and falls back to a byte-length estimate otherwise.
+"""
+
+import re
+from functools import lru_cache
+from typing import List
+
+TOKEN_MODEL = "gpt-4o"
+
+# Without tiktoken, up to three ASCII letters or digits, or any other single character, make a token
+_FALLBACK_TOKEN = re.compile(r"\s*(?:[A-Za-z0-9]{1,3}|[^\sA-Za-z0-9])|\s+$")
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """
+    This function returns the tiktoken encoding of the chat model.
+
+    Returns:
+        tiktoken.Encoding: The encoding, or None if tiktoken is not available.
+    """
+    try:
+        import tiktoken  # pylint: disable=import-outside-toplevel
+
+        return tiktoken.encoding_for_model(TOKEN_MODEL)
+    except Exception:  # pylint: disable=broad-exception-caught
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    This function counts the tokens of a text.
+
+    Args:
+        text (str): The text to count.
+
+    Returns:
+        int: The number of tokens. Without tiktoken, one token per three UTF-8 bytes.
+    """
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text.encode("utf-8")) + 2) // 3
+
+
+def count_message_tokens(messages) -> int:
+    """
+    This function counts the tokens of chat messages, including the per-message overhead.
+
+    Args:
+        messages (list[dict]): The chat messages.
+
+    Returns:
+        int: The number of tokens.
+    """
+    return sum(count_tokens(message.get("content") or "") + 4 for message in messages) + 2
+
+
+def tokenize(text: str) -> List:
+    """
+    This function splits a text into tokens that detokenize() joins back.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The token ids, or the text pieces without tiktoken.
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.encode(text, disallowed_special=())
+    return _FALLBACK_TOKEN.findall(text)
+
+
+def detokenize(tokens: List) -> str:
+    """
+    This function joins tokens from tokenize() back into a text.
+
+    Args:
+        tokens (list): The tokens.
+
+    Returns:
+        str: The text.
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(tokens)
+    return "".join(tokens)
+
+
+def _ends_on_character(data: bytes) -> bool:
+    # Find the lead byte of the last character and check that all its continuation bytes are there
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:
+            length = 1 if byte < 0x80 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return back >= length
+    return True
+
+
+def character_boundary(tokens: List, index: int) -> int:
+    """
+    This function moves a cut of the tokens back until the tokens before it decode to whole characters.
+    Byte-level tokens can split a character, e.g. a rare Hangul syllable or an emoji.
+
+    Args:
+        tokens (list): The tokens from tokenize().
+        index (int): The index of the cut.
+
+    Returns:
+        int: The largest index up to `index` where the cut falls between characters, or 0.
+    """
+    encoding = get_encoding()
+    if encoding is None:
+        return index
+    while index > 0 and not _ends_on_character(encoding.decode_bytes(tokens[max(0, index - 4) : index])):
+        index -= 1
+    return index
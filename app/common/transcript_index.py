@@ -0,0 +1,162 @@
+"""
+This module indexes YouTube transcripts so a question only sends the relevant parts to the model.
+
+Transcript segments are windowed into timestamp-aligned chunks that are embedded once per video.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List
+
+import numpy as np
+
+from settings import transcript_chunk_tokens, transcript_top_k, transcript_index_size
+from common.client import OpenAIClient, get_openai_client
+from common.metrics import cache_lookups
+from common.tokens import count_tokens
+
+
+@dataclass
+class TranscriptChunk:
+    """
+    This class is a data class for storing a window of transcript segments.
+
+    Attributes:
+        start (float): The start of the first segment in seconds.
+        end (float): The end of the last segment in seconds.
+        text (str): The text of the segments.
+    """
+
+    start: float
+    end: float
+    text: str
+
+    def to_prompt(self) -> str:
+        """
+        This method formats the chunk with its timestamps for a prompt.
+
+        Returns:
+            str: The chunk as "[start-end] text".
+        """
+        return f"[{self.start:.0f}s-{self.end:.0f}s] {self.text}"
+
+
+def chunk_transcript(segments: List[dict], chunk_tokens: int = transcript_chunk_tokens) -> List[TranscriptChunk]:
+    """
+    This function windows transcript segments into chunks of about chunk_tokens tokens.
+    Chunks always start and end on segment boundaries.
+
+    Args:
+        segments (list[dict]): The transcript segments with 'start', 'duration' and 'text'.
+        chunk_tokens (int): The number of tokens per chunk.
+
+    Returns:
+        list[TranscriptChunk]: The chunks in time order.
+    """
+    chunks = []
+    texts, tokens, start, end = [], 0, 0.0, 0.0
+    for segment in segments:
+        text = segment.get("text") or ""
+        if not texts:
+            start = segment.get("start") or 0.0
+        texts.append(text)
+        tokens += count_tokens(text)
+        end = (segment.get("start") or 0.0) + (segment.get("duration") or 0.0)
+        if tokens >= chunk_tokens:
+            chunks.append(TranscriptChunk(start=start, end=end, text=" ".join(texts)))
+            texts, tokens = [], 0
+    if texts:
+        chunks.append(TranscriptChunk(start=start, end=end, text=" ".join(texts)))
+    return chunks
+
+
+class TranscriptIndex:
+    """
+    This class finds the transcript chunks most relevant to a question.
+
+    Attributes:
+        chunks (list[TranscriptChunk]): The chunks of the transcript in time order.
+    """
+
+    def __init__(self, chunks: List[TranscriptChunk], client: OpenAIClient = None):
+        self.chunks = chunks
+        self.client = client
+        self._vectors = None
+        self._lock = threading.Lock()
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        return (self.client or get_openai_client()).unit_embeddings(texts)
+
+    def vectors(self) -> np.ndarray:
+        """
+        This method returns the chunk embeddings, embedding the chunks on first use.
+
+        Returns:
+            np.ndarray: The unit embeddings, one row per chunk.
+        """
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = self._embed([chunk.text for chunk in self.chunks])
+            return self._vectors
+
+    def query(self, question: str, k: int = transcript_top_k) -> List[TranscriptChunk]:
+        """
+        This method returns the chunks most relevant to the question.
+        Short transcripts of at most k chunks are returned whole without any embedding call.
+
+        Args:
+            question (str): The question of the user.
+            k (int): The number of chunks to return.
+
+        Returns:
+            list[TranscriptChunk]: The relevant chunks in time order.
+        """
+        if len(self.chunks) <= k:
+            return list(self.chunks)
+        scores = self.vectors() @ self._embed([question])[0]
+        top = np.argpartition(-scores, k)[:k]
+        return [self.chunks[i] for i in sorted(top)]
+
+
+class TranscriptIndexCache:
+    """
+    This class keeps the indexes of the most recently asked videos for the whole process.
+    """
+
+    def __init__(self, load: Callable[[str], List[dict]], max_entries: int = transcript_index_size):
+        self.load = load
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, video_id: str) -> TranscriptIndex:
+        """
+        This method returns the index of the video, loading its transcript on first use.
+
+        Args:
+            video_id (str): The id of the youtube video.
+
+        Returns:
+            TranscriptIndex: The index of the transcript.
+        """
+        with self._lock:
+            if video_id in self._indexes:
+                self._indexes.move_to_end(video_id)
+                cache_lookups.inc(cache="transcript_index", result="hit")
+                return self._indexes[video_id]
+
+        cache_lookups.inc(cache="transcript_index", result="miss")
+        index = TranscriptIndex(chunk_transcript(self.load(video_id)))
+        with self._lock:
+            self._indexes[video_id] = index
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+    def clear(self):
+        """
+        This method drops every index.
+        """
+        with self._lock:
+            self._indexes.clear()
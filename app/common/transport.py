@@ -0,0 +1,159 @@
+"""
+This module provides a process-wide pooled HTTP transport for the search API clients.
+
+Each host gets one keep-alive session, so searches reuse TCP and TLS connections
+across calls, Streamlit sessions and reruns. Inside a fan-out task, a request and its retries
+stop at the deadline of the fan-out, so an abandoned search does not keep its worker.
+"""
+
+import random
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from settings import http_pool_size, http_connect_timeout, http_read_timeout, http_retries, http_backoff
+from common.fan_out import remaining
+
+# A 429 is not retried: it goes back to the caller, since a retry would bypass the rate limiter
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class HTTPTransport:
+    """
+    This class keeps one pooled keep-alive session per host with timeouts and jittered retries.
+
+    Attributes:
+        pool_size (int): The maximum number of connections kept per host.
+        timeout (tuple): The connect and read timeouts in seconds.
+        retries (int): The number of retries on connection errors and 5xx responses.
+        backoff (float): The backoff factor in seconds between retries.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = http_pool_size,
+        connect_timeout: float = http_connect_timeout,
+        read_timeout: float = http_read_timeout,
+        retries: int = http_retries,
+        backoff: float = http_backoff,
+    ):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        # The retries are sent by get, which knows the deadline of the request
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session(self, url: str) -> requests.Session:
+        """
+        This method returns the keep-alive session for the host of the url.
+
+        Args:
+            url (str): The url to request.
+
+        Returns:
+            requests.Session: The session for the host.
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = self._new_session()
+            return self._sessions[host]
+
+    def get(self, url: str, params: dict = None, headers: dict = None, budget: float = None) -> requests.Response:
+        """
+        This method sends a GET request through the session for the host of the url.
+        Connection errors and 5xx responses are retried with jittered exponential backoff,
+        as long as the next attempt starts before the end of the budget.
+
+        Args:
+            url (str): The url to request.
+            params (dict): The query parameters.
+            headers (dict): The request headers.
+            budget (float): The seconds the request and its retries may take
+                (default: the time left of the current fan-out task, or no limit outside a fan-out).
+
+        Returns:
+            requests.Response: The response, or the last 5xx response when the retries are exhausted.
+
+        Raises:
+            requests.ConnectionError: If the last attempt could not connect.
+            requests.Timeout: If the last attempt timed out or the budget is spent.
+        """
+        budget = remaining() if budget is None else budget
+        deadline = None if budget is None else time.monotonic() + budget
+        session = self.session(url)
+        attempt = 0
+        while True:
+            timeout = self.timeout
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise requests.Timeout(f"The deadline passed before requesting {url}")
+                timeout = tuple(min(seconds, left) for seconds in self.timeout)
+            try:
+                response = session.get(url, params=params, headers=headers, timeout=timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            delay = self.backoff * 2**attempt + random.uniform(0, self.backoff)
+            if attempt >= self.retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        """
+        This method reports the connections opened per host.
+
+        Returns:
+            dict: The number of connections opened by the pool of each host.
+        """
+        with self._lock:
+            sessions = dict(self._sessions)
+        stats = {}
+        for host, session in sessions.items():
+            connections = 0
+            for adapter in session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    connections += pool.num_connections if pool else 0
+            stats[host] = connections
+        return stats
+
+    def close(self):
+        """
+        This method closes every session of the transport.
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+@lru_cache(maxsize=1)
+def get_transport() -> HTTPTransport:
+    """
+    This function returns the process-wide HTTP transport.
+
+    Returns:
+        HTTPTransport: The shared transport.
+    """
+    return HTTPTransport()
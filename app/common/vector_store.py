@@ -0,0 +1,197 @@
+"""
+This module persists embeddings on disk and queries them by cosine similarity.
+
+Each store is a directory with a contiguous float32 matrix file that is memory-mapped for queries
+and a JSON sidecar with the ids and texts of the rows.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Iterable, List, Tuple, Union
+
+import numpy as np
+
+from settings import vector_store_dir
+from common.client import OpenAIClient, get_openai_client
+from common.embedding import Embedding, EmbeddingBatch, as_matrix
+from common.pdf_ingest import ingest_pdf
+
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+
+
+class VectorStore:
+    """
+    This class is an append-only embedding store with tombstone deletes and top-k cosine queries.
+    Vectors are normalized when they are added, so the cosine similarity is a dot product.
+
+    Attributes:
+        path (str): The directory of the store.
+        dim (int): The dimension of the vectors, None while the store is empty.
+        ids (list): The id of each row.
+        texts (list): The text of each row.
+        deleted (set): The indexes of the deleted rows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim = None
+        self.ids = []
+        self.texts = []
+        self.deleted = set()
+        self._matrix = None
+        self._lock = threading.Lock()
+
+        if os.path.exists(os.path.join(path, META_FILE)):
+            with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            self.ids = meta["ids"]
+            self.texts = meta["texts"]
+            self.deleted = set(meta["deleted"])
+
+    def __len__(self):
+        return len(self.ids) - len(self.deleted)
+
+    def _save_meta(self):
+        meta = {"dim": self.dim, "ids": self.ids, "texts": self.texts, "deleted": sorted(self.deleted)}
+        tmp_path = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def matrix(self) -> np.ndarray:
+        """
+        This method returns the memory-mapped matrix of the stored vectors.
+
+        Returns:
+            np.ndarray: The read-only (rows, dim) float32 matrix.
+        """
+        with self._lock:
+            if self._matrix is None and self.ids:
+                self._matrix = np.memmap(
+                    os.path.join(self.path, VECTORS_FILE), dtype=np.float32, mode="r", shape=(len(self.ids), self.dim)
+                )
+            return self._matrix if self._matrix is not None else np.zeros((0, self.dim or 0), dtype=np.float32)
+
+    def add(self, embeddings: Union[EmbeddingBatch, Iterable[Embedding]]):
+        """
+        This method appends embeddings to the store.
+
+        Args:
+            embeddings (EmbeddingBatch | Iterable[Embedding]): The embeddings to add.
+        """
+        if not isinstance(embeddings, EmbeddingBatch):
+            embeddings = EmbeddingBatch.from_embeddings(embeddings)
+        if len(embeddings) == 0:
+            return
+        vectors = as_matrix(embeddings)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+                # Drop rows written by an add that failed before its metadata was saved
+                f.truncate(len(self.ids) * self.dim * 4)
+                vectors.tofile(f)
+            self.ids.extend(embeddings.ids)
+            self.texts.extend(embeddings.texts)
+            self._save_meta()
+            self._matrix = None
+
+    def delete(self, ids: Iterable):
+        """
+        This method deletes the rows with the ids from the query results.
+
+        Args:
+            ids (Iterable): The ids to delete.
+        """
+        ids = set(ids)
+        with self._lock:
+            self.deleted.update(i for i, row_id in enumerate(self.ids) if row_id in ids)
+            self._save_meta()
+
+    def query(self, vector: List[float], k: int = 5) -> List[Tuple[Embedding, float]]:
+        """
+        This method returns the stored embeddings most similar to the vector.
+
+        Args:
+            vector (list[float]): The query vector.
+            k (int): The number of results.
+
+        Returns:
+            list[tuple[Embedding, float]]: The embeddings and their cosine similarity, most similar first.
+        """
+        matrix = self.matrix()
+        if len(self) == 0 or k <= 0:
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (vector / max(np.linalg.norm(vector), 1e-12))
+        if self.deleted:
+            scores[list(self.deleted)] = -np.inf
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (Embedding(id=self.ids[i], vector=np.array(matrix[i]), text=self.texts[i]), float(scores[i])) for i in top
+        ]
+
+    def query_text(self, text: str, k: int = 5, client: OpenAIClient = None) -> List[Tuple[Embedding, float]]:
+        """
+        This method embeds the text and returns the stored embeddings most similar to it.
+
+        Args:
+            text (str): The query text.
+            k (int): The number of results.
+            client (OpenAIClient): The client for the embedding (default: the shared client).
+
+        Returns:
+            list[tuple[Embedding, float]]: The embeddings and their cosine similarity, most similar first.
+        """
+        response = (client or get_openai_client()).embeddings(text)
+        return self.query(response.data[0].embedding, k)
+
+
+def get_pdf_store(pdf_path: str, client: OpenAIClient = None) -> VectorStore:
+    """
+    This function returns the vector store of a PDF, embedding the PDF only if it was never stored.
+    Stores are named after the hash of the PDF content, so they survive restarts and renames.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        client (OpenAIClient): The client for the embeddings (default: the shared client).
+
+    Returns:
+        VectorStore: The store of the PDF chunks.
+    """
+    digest = hashlib.sha1()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    path = os.path.join(vector_store_dir, digest.hexdigest())
+    if not os.path.exists(path):
+        # Ingest into a partial store of this process first, so an interrupted ingestion is never mistaken
+        # for a complete one and concurrent ingestions of the same PDF do not touch each other's files
+        os.makedirs(vector_store_dir, exist_ok=True)
+        partial_path = tempfile.mkdtemp(prefix=f"{digest.hexdigest()}.", suffix=".partial", dir=vector_store_dir)
+        try:
+            partial = VectorStore(partial_path)
+            for _, embeddings in ingest_pdf(pdf_path, client or get_openai_client()):
+                partial.add(embeddings)
+            os.replace(partial_path, path)
+        except OSError:
+            # Another process stored the same PDF first
+            if not os.path.exists(path):
+                raise
+        finally:
+            shutil.rmtree(partial_path, ignore_errors=True)
+    return VectorStore(path)
@@ -5,6 +5,8 @@ This is index page for my app.
 import streamlit as st
 from st_pages import add_page_title, get_nav_from_toml
 
+from settings import metrics_panel
+
 st.set_page_config(layout="wide")
 
 nav = get_nav_from_toml(".streamlit/pages_sections.toml")
@@ -14,3 +16,8 @@ pg = st.navigation(nav)
 add_page_title(pg)
 
 pg.run()
+
+if metrics_panel:
+    from common.streamlit_utils import display_metrics_panel  # pylint: disable=import-outside-toplevel
+
+    display_metrics_panel()
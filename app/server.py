@@ -0,0 +1,399 @@
+"""
+This is a headless HTTP API for the chat engines, next to the Streamlit app in run.py.
+
+Requests are served by an async loop, and the blocking engines run in a bounded worker pool.
+When every worker is busy and the queue is full, requests are rejected with 503.
+
+Run:
+    uvicorn server:app --host 0.0.0.0 --port 8000
+
+Endpoints:
+    GET  /health   The status and the load of the worker pool.
+    POST /chat     {"session_id": optional, "message": str, "stream": bool}
+    POST /search   {"session_id": optional, "question": str, "history": list, "stream": bool}
+    POST /youtube  {"session_id": optional, "question": str, "url" or "video_id": str, "history": list, "stream": bool}
+With "stream": true, the answer is sent as server-sent events of {"text": ...} followed by a "done" event.
+The turns of a session run one at a time; the next ones wait without holding a worker.
+Session ids are issued by the server with an HMAC signature, so a client cannot pick the id of another session.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from settings import api_workers, api_queue_size, api_sessions, api_session_secret
+from common.ask_for_youtube import get_answer_in_youtube, get_youtube_video_id_from_url
+from common.ask_with_search import chat_with_search
+from common.chat import Chat
+from common.client import openai_clients
+from common.conversation_store import conversations
+from common.history import HistoryWindow
+from common.metrics import registry
+from common.rate_limit import RateLimitExceeded, rate_limiter
+from common.single_flight import search_flights, llm_flights
+from common.transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class BadRequest(ValueError):
+    """
+    This exception is raised for a request body missing a required field.
+    """
+
+
+class WorkerPool:
+    """
+    This class runs blocking calls in a bounded thread pool with admission control.
+    A request holds a slot from its admission until its response is sent.
+
+    Attributes:
+        workers (int): The number of worker threads.
+        capacity (int): The number of requests admitted at once, running or queued.
+        in_flight (int): The number of requests admitted.
+    """
+
+    def __init__(self, workers: int = api_workers, queue_size: int = api_queue_size):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """
+        This method admits a request if the pool is not saturated.
+
+        Returns:
+            bool: Whether the request was admitted.
+        """
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        """
+        This method frees the slot of a finished request.
+        """
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, func: Callable, *args):
+        """
+        This method runs a blocking call in the pool.
+
+        Args:
+            func (Callable): The blocking function.
+            *args: The arguments of the function.
+
+        Returns:
+            The result of the function.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def iterate(self, iterator: Iterator):
+        """
+        This method consumes a blocking iterator in the pool.
+
+        Args:
+            iterator (Iterator): The blocking iterator.
+
+        Returns:
+            AsyncIterator: The items of the iterator.
+        """
+        while True:
+            item = await self.run(next, iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+
+@dataclass
+class ChatSession:
+    """
+    This class is a data class for storing the state of an API session on one endpoint.
+
+    Attributes:
+        session_id (str): The id of the session.
+        lock (asyncio.Lock): The lock serializing the turns of the session, held by the request coroutines.
+        window (HistoryWindow): The token budget window of the history sent by the client.
+    """
+
+    session_id: str
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    window: HistoryWindow = field(default_factory=HistoryWindow)
+    _chat: Chat = None
+
+    @property
+    def chat(self) -> Chat:
+        """
+        The Chat of the session on its stored history. It reads the store, so only use it in the worker pool.
+        """
+        if self._chat is None:
+            self._chat = Chat(history=conversations.history(f"api:{self.session_id}"))
+        return self._chat
+
+
+class ChatSessions:
+    """
+    This class keeps the most recently active sessions.
+    The chat histories are stored, so a session dropped from here resumes its conversation.
+    """
+
+    def __init__(self, max_sessions: int = api_sessions):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # (endpoint, session id) -> ChatSession
+        self._lock = threading.Lock()
+
+    def get(self, endpoint: str, session_id: str) -> ChatSession:
+        """
+        This method returns a session, dropping the least recently used idle ones over the limit.
+
+        Args:
+            endpoint (str): The endpoint of the session, e.g. 'chat' or 'search'.
+            session_id (str): The id of the session.
+
+        Returns:
+            ChatSession: The session.
+        """
+        key = (endpoint, session_id)
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = ChatSession(session_id)
+            self._sessions.move_to_end(key)
+            if len(self._sessions) > self.max_sessions:
+                # A session in the middle of a turn is kept, so its next turn waits for the same lock
+                idle = [other for other, session in self._sessions.items() if not session.lock.locked()]
+                for other in idle[: len(self._sessions) - self.max_sessions]:
+                    del self._sessions[other]
+            return self._sessions[key]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+pool = WorkerPool()
+sessions = ChatSessions()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _respond(
+    request_body: dict, make_stream: Callable[[], Iterator[str]], extra: dict = None, lock: asyncio.Lock = None
+):
+    """
+    This function runs an engine in the pool and sends its answer as JSON or as server-sent events.
+    The lock of the session is awaited on the event loop, so waiting turns do not hold a worker.
+    A streamed response waits for the first piece before it starts, so the upstream calls before the answer,
+    such as a rejection of the rate limiter, still get their own status. It releases the lock and the slot
+    of the request once it is sent.
+    """
+    extra = extra or {}
+    lock = lock or asyncio.Lock()
+    await lock.acquire()
+    streamed = False
+    try:
+        if not request_body.get("stream"):
+            answer = await pool.run(lambda: "".join(make_stream()))
+            return JSONResponse({"answer": answer, **extra})
+        stream = make_stream()
+        first = await pool.run(next, stream, _END)
+        streamed = True
+    finally:
+        if not streamed:
+            lock.release()
+
+    async def events():
+        try:
+            if first is not _END:
+                yield _sse("message", {"text": first})
+            async for text in pool.iterate(stream):
+                yield _sse("message", {"text": text})
+            yield _sse("done", extra)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.exception("stream failed")
+            yield _sse("error", {"error": str(e)})
+        finally:
+            lock.release()
+            pool.release()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _as_stream(answer: Callable) -> Iterator[str]:
+    # The engine is only called once the stream is consumed, in the worker pool
+    answer = answer()
+    if isinstance(answer, str):
+        yield answer
+    else:
+        yield from answer
+
+
+def _signature(value: str) -> str:
+    return hmac.new(api_session_secret.encode(), value.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _session_id(body: dict) -> str:
+    # A new session gets a signed id, and only ids signed by this server are accepted
+    session_id = body.get("session_id")
+    if not session_id:
+        value = uuid.uuid4().hex
+        return f"{value}.{_signature(value)}"
+    value, _, signature = str(session_id).partition(".")
+    if not hmac.compare_digest(signature, _signature(value)):
+        raise BadRequest("Unknown 'session_id'")
+    return session_id
+
+
+def _required(body: dict, name: str):
+    if not body.get(name):
+        raise BadRequest(f"'{name}' is required")
+    return body[name]
+
+
+def admitted(handler):
+    """
+    This decorator parses the JSON body and rejects the request with 503 when the pool is saturated.
+    The slot of the request is released when the handler returns, unless its response is streamed.
+    """
+
+    async def wrapper(request: Request):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            return JSONResponse({"error": "The body must be a JSON object"}, status_code=400)
+        if not pool.acquire():
+            return JSONResponse({"error": "The server is saturated"}, status_code=503, headers={"Retry-After": "1"})
+
+        streamed = False
+        try:
+            response = await handler(body)
+            streamed = isinstance(response, StreamingResponse)
+            return response
+        except BadRequest as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        except RateLimitExceeded as e:
+            return JSONResponse(
+                {"error": str(e)}, status_code=429, headers={"Retry-After": str(max(1, round(e.retry_after)))}
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.exception("request failed")
+            return JSONResponse({"error": str(e)}, status_code=500)
+        finally:
+            if not streamed:
+                pool.release()
+
+    return wrapper
+
+
+def _health() -> dict:
+    # Blocking: the conversation store lock is held across SQLite writes and the rate limits read SQLite
+    return {
+        "status": "ok",
+        "workers": pool.workers,
+        "capacity": pool.capacity,
+        "in_flight": pool.in_flight,
+        "sessions": len(sessions),
+        "conversations": conversations.stats(),
+        "coalescing": {"search": search_flights.stats(), "llm": llm_flights.stats()},
+        "rate_limits": rate_limiter.usage(),
+        "openai_clients": openai_clients.stats(),
+        "search_connections": get_transport().stats(),
+    }
+
+
+async def health(_: Request):
+    """
+    GET /health
+    """
+    # Off the event loop, and outside the worker pool so it answers while the pool is saturated
+    return JSONResponse(await asyncio.to_thread(_health))
+
+
+async def metrics(_: Request):
+    """
+    GET /metrics
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@admitted
+async def chat(body: dict):
+    """
+    POST /chat
+    """
+    message = _required(body, "message")
+    session_id = _session_id(body)
+    session = sessions.get("chat", session_id)
+    return await _respond(
+        body, lambda: _as_stream(lambda: session.chat.discuss_stream(message)), {"session_id": session_id}, session.lock
+    )
+
+
+@admitted
+async def search(body: dict):
+    """
+    POST /search
+    """
+    question = _required(body, "question")
+    history = list(body.get("history") or [])
+    session_id = _session_id(body)
+    session = sessions.get("search", session_id)
+    return await _respond(
+        body,
+        lambda: _as_stream(lambda: chat_with_search(question, history, stream=True, window=session.window)),
+        {"session_id": session_id},
+        session.lock,
+    )
+
+
+@admitted
+async def youtube(body: dict):
+    """
+    POST /youtube
+    """
+    question = _required(body, "question")
+    history = list(body.get("history") or [])
+    video_id = body.get("video_id") or get_youtube_video_id_from_url(body.get("url") or "")
+    session_id = _session_id(body)
+    session = sessions.get("youtube", session_id)
+    return await _respond(
+        body,
+        lambda: _as_stream(
+            lambda: get_answer_in_youtube(video_id, question, history, stream=True, window=session.window)
+        ),
+        {"video_id": video_id, "session_id": session_id},
+        session.lock,
+    )
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/chat", chat, methods=["POST"]),
+        Route("/search", search, methods=["POST"]),
+        Route("/youtube", youtube, methods=["POST"]),
+    ]
+)
@@ -3,8 +3,89 @@ This file is used to store the settings for the app.
 '''
 
 import os
+import secrets
 
 root_dir = os.path.dirname(os.path.abspath(__file__))
 data_dir = os.path.join(os.path.abspath(os.path.join(root_dir, os.pardir)), 'data')
 
-secret_path = os.path.join(os.path.abspath(os.path.join(root_dir, os.pardir)), 'secret.yaml')
+secret_path = os.getenv("SECRET_PATH", os.path.join(os.path.abspath(os.path.join(root_dir, os.pardir)), 'secret.yaml'))
+
+openai_base_url = os.getenv("OPENAI_BASE_URL") or None
+naver_base_url = os.getenv("NAVER_BASE_URL", "https://openapi.naver.com/v1/search")
+kakao_base_url = os.getenv("KAKAO_BASE_URL", "https://dapi.kakao.com")
+google_base_url = os.getenv("GOOGLE_BASE_URL", "https://www.googleapis.com/customsearch/v1")
+
+search_deadline = float(os.getenv("SEARCH_DEADLINE", "8"))
+search_speculation = os.getenv("SEARCH_SPECULATION", "false").lower() == "true"
+speculative_service_type = os.getenv("SPECULATIVE_SERVICE_TYPE", "WEBKR")
+
+http_pool_size = int(os.getenv("HTTP_POOL_SIZE", "10"))
+http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+http_read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+http_retries = int(os.getenv("HTTP_RETRIES", "2"))
+http_backoff = float(os.getenv("HTTP_BACKOFF", "0.3"))
+
+search_cache_path = os.path.join(data_dir, "search_cache.sqlite3")
+search_cache_size = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))
+search_cache_ttl = int(os.getenv("SEARCH_CACHE_TTL", "3600"))
+search_cache_recent_ttl = int(os.getenv("SEARCH_CACHE_RECENT_TTL", "300"))
+
+semantic_cache_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+semantic_cache_size = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+
+rerank_top_k = int(os.getenv("RERANK_TOP_K", "8"))
+rerank_token_cap = int(os.getenv("RERANK_TOKEN_CAP", "2000"))
+rerank_duplicate_threshold = float(os.getenv("RERANK_DUPLICATE_THRESHOLD", "0.92"))
+
+history_token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+history_summary_batch_tokens = int(os.getenv("HISTORY_SUMMARY_BATCH_TOKENS", "6000"))
+history_summary_max_batches = int(os.getenv("HISTORY_SUMMARY_MAX_BATCHES", "3"))
+history_display_window = int(os.getenv("HISTORY_DISPLAY_WINDOW", "20"))
+history_display_page = int(os.getenv("HISTORY_DISPLAY_PAGE", "20"))
+
+conversation_store_path = os.path.join(data_dir, "conversations.sqlite3")
+conversation_hot_messages = int(os.getenv("CONVERSATION_HOT_MESSAGES", "40"))
+conversation_memory_cap = int(os.getenv("CONVERSATION_MEMORY_CAP", str(64 * 1024 * 1024)))
+# Idle conversations are deleted after these delays; anonymous ones are never resumed after their session
+conversation_retention_days = float(os.getenv("CONVERSATION_RETENTION_DAYS", "30"))
+conversation_anonymous_retention_hours = float(os.getenv("CONVERSATION_ANONYMOUS_RETENTION_HOURS", "24"))
+
+transcript_chunk_tokens = int(os.getenv("TRANSCRIPT_CHUNK_TOKENS", "300"))
+transcript_top_k = int(os.getenv("TRANSCRIPT_TOP_K", "6"))
+transcript_index_size = int(os.getenv("TRANSCRIPT_INDEX_SIZE", "32"))
+
+vector_store_dir = os.path.join(data_dir, "vector_store")
+
+pdf_chunk_tokens = int(os.getenv("PDF_CHUNK_TOKENS", "500"))
+pdf_chunk_overlap = int(os.getenv("PDF_CHUNK_OVERLAP", "50"))
+embedding_batch_tokens = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))
+embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+embedding_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+pdf_extract_workers = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+pdf_parallel_min_pages = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+pdf_pages_per_task = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+metrics_panel = os.getenv("METRICS_PANEL", "false").lower() == "true"
+
+chat_structured_dispatch = os.getenv("CHAT_STRUCTURED_DISPATCH", "true").lower() == "true"
+
+api_workers = int(os.getenv("API_WORKERS", "8"))
+api_queue_size = int(os.getenv("API_QUEUE_SIZE", "16"))
+api_sessions = int(os.getenv("API_SESSIONS", "1000"))
+# The fan-out workers of each provider: a speculative and a planned search for every API worker
+search_workers = int(os.getenv("SEARCH_WORKERS", str(2 * api_workers)))
+# Signs the API session ids; set it to keep the sessions valid across restarts and processes
+api_session_secret = os.getenv("API_SESSION_SECRET") or secrets.token_hex(32)
+
+rate_limit_backend = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+rate_limit_path = os.path.join(data_dir, "rate_limit.sqlite3")
+rate_limit_timeout = float(os.getenv("RATE_LIMIT_TIMEOUT", "10"))
+openai_rps = float(os.getenv("OPENAI_RPS", "5"))
+openai_tpm = int(os.getenv("OPENAI_TPM", "30000"))
+openai_embedding_rps = float(os.getenv("OPENAI_EMBEDDING_RPS", "5"))
+openai_embedding_tpm = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+search_rps = float(os.getenv("SEARCH_RPS", "10"))
+naver_daily_quota = int(os.getenv("NAVER_DAILY_QUOTA", "25000"))
+kakao_daily_quota = int(os.getenv("KAKAO_DAILY_QUOTA", "30000"))
+google_daily_quota = int(os.getenv("GOOGLE_DAILY_QUOTA", "100"))